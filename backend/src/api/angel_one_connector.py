@@ -1,12 +1,19 @@
 import os
 from dotenv import load_dotenv
-from SmartApi import SmartConnect
-import pyotp
 from logzero import logger
 from typing import Optional, Dict, Any
+from urllib3.util.retry import Retry
 
 load_dotenv()
 
+# HTTPAdapter settings for SmartConnect's session. Without a pool SmartConnect
+# sends every call through bare requests.post and pays a new TLS handshake
+HTTP_POOL = {
+    'pool_connections': 16,
+    'pool_maxsize': 32,
+    'max_retries': Retry(total=3, backoff_factor=0.2)
+}
+
 class AngelOneConnector:
     def __init__(self):
         """Initialize the Angel One connector with credentials from environment variables."""
@@ -41,8 +48,12 @@ class AngelOneConnector:
         Returns:
             bool: True if connection is successful, False otherwise
         """
+        # Imported here so importing this module (e.g. for HTTP_POOL) skips the SmartApi stack
+        from SmartApi import SmartConnect
+        import pyotp
+        
         try:
-            self.api = SmartConnect(api_key=self.api_key)
+            self.api = SmartConnect(api_key=self.api_key, pool=HTTP_POOL)
             totp = pyotp.TOTP(self.totp_secret)
             data = self.api.generateSession(self.client_id, self.pin, totp.now())
             
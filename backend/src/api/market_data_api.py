@@ -1,25 +1,98 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 import duckdb
+import orjson
 import os
-from datetime import datetime
-import pytz
+import pyarrow as pa
+import secrets
+import time
+from contextlib import asynccontextmanager
+from itertools import chain
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from zoneinfo import ZoneInfo
 from typing import List, Dict, Any, Optional
 from logzero import logger
 from pydantic import BaseModel, Field
 
 # Constants
-IST = pytz.timezone('Asia/Kolkata')
+IST = ZoneInfo('Asia/Kolkata')
+CACHE_TTL_SECONDS = 60
+STREAM_BATCH_ROWS = 4096
 
-# Global test connection for testing
-test_db_connection = None
+# Serialized /api/v1/market-data payload and its validators, reused within the TTL on the same IST day
+_CACHE = {'key': None, 'payload': None, 'headers': None, 'ts': 0.0}
+
+def _now_naive_ist() -> datetime:
+    """Current IST wall-clock time, naive like the stored last_updated values"""
+    return datetime.now(IST).replace(tzinfo=None)
+
+def _validators(data_timestamp: Optional[datetime]) -> Dict[str, str]:
+    """ETag and Last-Modified headers for the snapshot last updated at data_timestamp"""
+    if data_timestamp is None:
+        return {}
+    return {
+        "ETag": f'"{data_timestamp.isoformat()}"',
+        "Last-Modified": format_datetime(data_timestamp.replace(tzinfo=IST).astimezone(timezone.utc), usegmt=True)
+    }
+
+def _not_modified(request: Request, headers: Dict[str, str]) -> bool:
+    """True if the client's If-None-Match already names the current snapshot"""
+    etag = headers.get("ETag")
+    if etag is None:
+        return False
+    return etag in (tag.strip() for tag in request.headers.get("if-none-match", "").split(","))
+
+def _snapshot_path() -> str:
+    """Location of the latest_market_data Parquet snapshot written by the refresh job"""
+    db_file = os.getenv('DB_FILE', 'nfo_data.duckdb')
+    export_dir = os.getenv('PARQUET_EXPORT_DIR', os.path.dirname(os.path.abspath(db_file)))
+    return os.path.join(export_dir, 'latest_market_data.parquet')
+
+def _snapshot_mtime() -> Optional[float]:
+    """Modification time of the snapshot, None if it does not exist"""
+    try:
+        return os.path.getmtime(_snapshot_path())
+    except OSError:
+        return None
+
+def _attach_snapshot(db: duckdb.DuckDBPyConnection) -> bool:
+    """Expose the exported latest_market_data Parquet snapshot as a view
+    
+    The refresh job swaps the file in atomically, so the view always reads a
+    complete snapshot and the API never locks the DuckDB file the job writes to.
+    
+    Returns:
+        bool: True if the snapshot exists and the view was created
+    """
+    snapshot = _snapshot_path()
+    if not os.path.exists(snapshot):
+        logger.warning(f"Market data snapshot not found at {snapshot}")
+        return False
+    
+    db.execute(f"""
+        CREATE OR REPLACE VIEW latest_market_data AS
+        SELECT * FROM read_parquet('{snapshot.replace("'", "''")}')
+    """)
+    return True
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open one in-memory DuckDB connection for the lifetime of the app"""
+    app.state.db = duckdb.connect(':memory:')
+    app.state.db.execute("SET enable_object_cache = true")
+    app.state.snapshot_ready = _attach_snapshot(app.state.db)
+    yield
+    app.state.db.close()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="NFO Dashboard API",
     description="API for serving NFO market data and technical indicators",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -73,124 +146,203 @@ class MarketDataResponse(BaseModel):
     count: int = Field(..., description="Number of records")
     last_updated: datetime = Field(..., description="Data timestamp")
 
-def set_test_db(connection):
-    """Set the test database connection"""
-    global test_db_connection
-    test_db_connection = connection
+# Project exactly the response fields, so columns added to the snapshot are never read
+_MARKET_DATA_COLUMNS = tuple(MarketData.model_fields)
+_MARKET_DATA_PROJECTION = ', '.join(
+    'CAST(date AS TIMESTAMP) AS date' if name == 'date' else name for name in _MARKET_DATA_COLUMNS
+)
+_TOKEN_QUERY = f"""
+    SELECT {_MARKET_DATA_PROJECTION}
+    FROM latest_market_data
+    WHERE token = ?
+"""
+_STREAM_QUERY = f"""
+    SELECT {_MARKET_DATA_PROJECTION}
+    FROM latest_market_data
+    ORDER BY symbol ASC
+"""
+# Same rows with the envelope aggregates appended, so both come from one scan of one snapshot
+_PAYLOAD_QUERY = f"""
+    SELECT
+        {_MARKET_DATA_PROJECTION},
+        COUNT(*) OVER () AS snapshot_count,
+        MAX(last_updated) OVER () AS snapshot_last_updated
+    FROM latest_market_data
+    ORDER BY symbol ASC
+"""
 
-def get_db_connection():
-    """Create and return a database connection"""
+def get_db(request: Request):
+    """Yield a cursor on the shared connection for the duration of a request
+    
+    Tests swap this out through app.dependency_overrides.
+    """
+    state = request.app.state
+    if not state.snapshot_ready:
+        state.snapshot_ready = _attach_snapshot(state.db)
+    
     try:
-        # Use test connection if available (for testing)
-        if test_db_connection is not None:
-            return test_db_connection
-            
-        # Otherwise, create new connection
-        db_file = os.getenv('DB_FILE', 'nfo_data.duckdb')
-        return duckdb.connect(db_file)
+        cursor = state.db.cursor()
     except Exception as e:
         logger.error(f"Database connection error: {e}")
         raise HTTPException(status_code=500, detail="Database connection failed")
+    try:
+        yield cursor
+    finally:
+        cursor.close()
 
 @app.get("/api/v1/market-data", response_model=MarketDataResponse)
-async def get_market_data() -> MarketDataResponse:
+def get_market_data(request: Request, con: duckdb.DuckDBPyConnection = Depends(get_db)) -> Response:
     """
     Get latest market data for all tokens
     Returns:
-        MarketDataResponse: Market data response object
+        Response: Serialized MarketDataResponse, streamed in record batches and
+            cached for CACHE_TTL_SECONDS; 304 if If-None-Match names the current snapshot
     """
+    # A new snapshot swapped in by the refresh job changes the key, so it is served immediately
+    cache_key = (datetime.now(IST).date(), _snapshot_mtime())
+    if _CACHE['key'] == cache_key and time.monotonic() - _CACHE['ts'] < CACHE_TTL_SECONDS:
+        if _not_modified(request, _CACHE['headers']):
+            return Response(status_code=304, headers=_CACHE['headers'])
+        return Response(content=_CACHE['payload'], media_type="application/json", headers=_CACHE['headers'])
+    
+    # The request cursor is closed before the body is sent, so the stream owns a cursor of its own
+    stream_con = con.cursor()
     try:
-        con = get_db_connection()
-        
-        # Get all market data
-        result = con.execute("""
-            SELECT *,
-                   MAX(last_updated) OVER () as data_timestamp
-            FROM latest_market_data
-            ORDER BY symbol ASC
-        """).fetchall()
-        
-        if not result:
-            return MarketDataResponse(
-                status="success",
-                message="No data found",
-                data=[],
-                count=0,
-                last_updated=datetime.now(IST).replace(tzinfo=None)
-            )
-        
-        # Convert to list of dictionaries
-        column_names = [desc[0] for desc in con.description]
-        market_data = []
-        data_timestamp = None
-        
-        for row in result:
-            data_dict = dict(zip(column_names, row))
-            data_timestamp = data_dict.pop('data_timestamp')
-            market_data.append(MarketData(**data_dict))
-        
-        return MarketDataResponse(
-            status="success",
-            message="Data retrieved successfully",
-            data=market_data,
-            count=len(market_data),
-            last_updated=data_timestamp or datetime.now(IST).replace(tzinfo=None)
-        )
+        # Cheap revalidation first; a snapshot swapped in right after it only makes the 304 a moment stale
+        current = _validators(con.execute("SELECT MAX(last_updated) FROM latest_market_data").fetchone()[0])
+        if _not_modified(request, current):
+            stream_con.close()
+            return Response(status_code=304, headers=current)
         
+        # The view re-reads the Parquet file on every query, so the count and ETag are taken
+        # from the rows actually streamed rather than from a separate aggregate query
+        batches = iter(stream_con.execute(_PAYLOAD_QUERY).fetch_record_batch(STREAM_BATCH_ROWS))
+        first = next((batch for batch in batches if batch.num_rows), None)
     except Exception as e:
+        stream_con.close()
         logger.error(f"Error fetching market data: {e}")
         raise HTTPException(
             status_code=500,
             detail=f"Error fetching market data: {str(e)}"
         )
-    finally:
-        # Only close if not using test connection
-        if 'con' in locals() and con is not test_db_connection:
-            con.close()
+    
+    if first is None:
+        count, data_timestamp = 0, None
+    else:
+        count = first.column(len(_MARKET_DATA_COLUMNS))[0].as_py()
+        data_timestamp = first.column(len(_MARKET_DATA_COLUMNS) + 1)[0].as_py()
+    headers = _validators(data_timestamp)
+    
+    # The envelope is known up front, so only the rows need to be streamed
+    header = orjson.dumps({
+        "status": "success",
+        "message": "Data retrieved successfully" if count else "No data found",
+        "count": count,
+        "last_updated": data_timestamp or _now_naive_ist()
+    })[:-1] + b',"data":['
+    
+    def body():
+        # Rows come straight from the typed latest_market_data schema, so skip validation and
+        # serialize one record batch at a time instead of holding every row as a Python object
+        chunks = [header]
+        try:
+            yield header
+            for batch in chain([first] if first is not None else [], batches):
+                if not batch.num_rows:
+                    continue
+                rows = pa.RecordBatch.from_arrays(
+                    batch.columns[:len(_MARKET_DATA_COLUMNS)], names=list(_MARKET_DATA_COLUMNS)
+                )
+                chunk = orjson.dumps(rows.to_pylist())[1:-1]
+                chunk = chunk if len(chunks) == 1 else b',' + chunk
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            stream_con.close()
+        chunks.append(b']}')
+        yield b']}'
+        _CACHE.update(key=cache_key, payload=b''.join(chunks), headers=headers, ts=time.monotonic())
+    
+    return StreamingResponse(body(), media_type="application/json", headers=headers)
+
+@app.get("/api/v1/market-data/stream")
+def stream_market_data(con: duckdb.DuckDBPyConnection = Depends(get_db)) -> StreamingResponse:
+    """
+    Stream latest market data for all tokens as NDJSON, one MarketData record per line
+    Returns:
+        StreamingResponse: application/x-ndjson body, read from DuckDB STREAM_BATCH_ROWS at a time
+    """
+    # The request cursor is closed before the body is sent, so the stream owns a cursor of its own
+    stream_con = con.cursor()
+    try:
+        reader = stream_con.execute(_STREAM_QUERY).fetch_record_batch(STREAM_BATCH_ROWS)
+    except Exception as e:
+        stream_con.close()
+        logger.error(f"Error streaming market data: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error streaming market data: {str(e)}"
+        )
+    
+    def rows():
+        try:
+            for batch in reader:
+                if batch.num_rows:
+                    yield b''.join(
+                        orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE) for row in batch.to_pylist()
+                    )
+        finally:
+            stream_con.close()
+    
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+@app.post("/api/v1/admin/flush")
+def flush_cache(x_admin_token: Optional[str] = Header(None)) -> Dict[str, str]:
+    """
+    Drop the cached /api/v1/market-data payload
+    
+    Requires the X-Admin-Token header to match ADMIN_TOKEN; the endpoint is
+    disabled when ADMIN_TOKEN is not set.
+    Returns:
+        Dict[str, str]: Status message
+    """
+    admin_token = os.getenv('ADMIN_TOKEN')
+    if not admin_token or not x_admin_token or not secrets.compare_digest(x_admin_token, admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+    
+    _CACHE.update(key=None, payload=None, headers=None, ts=0.0)
+    return {"status": "success", "message": "Market data cache flushed"}
 
 @app.get("/api/v1/market-data/{token}", response_model=MarketDataResponse)
-async def get_token_data(token: str) -> MarketDataResponse:
+def get_token_data(token: str, con: duckdb.DuckDBPyConnection = Depends(get_db)) -> Response:
     """
     Get latest market data for a specific token
     Args:
         token (str): Token ID
     Returns:
-        MarketDataResponse: Market data response object
+        Response: Serialized MarketDataResponse
     """
     try:
-        con = get_db_connection()
+        # Get data for specific token; token is the snapshot's primary key, so at most one row
+        row = con.execute(_TOKEN_QUERY, [token]).fetchone()
         
-        # Get data for specific token
-        result = con.execute("""
-            SELECT *,
-                   last_updated as data_timestamp
-            FROM latest_market_data
-            WHERE token = ?
-        """, [token]).fetchall()
-        
-        if not result:
+        if row is None:
             raise HTTPException(
                 status_code=404,
                 detail=f"No data found for token {token}"
             )
         
-        # Convert to list of dictionaries
-        column_names = [desc[0] for desc in con.description]
-        market_data = []
-        data_timestamp = None
-        
-        for row in result:
-            data_dict = dict(zip(column_names, row))
-            data_timestamp = data_dict.pop('data_timestamp')
-            market_data.append(MarketData(**data_dict))
+        market_data = MarketData.model_validate(dict(zip(_MARKET_DATA_COLUMNS, row)))
         
-        return MarketDataResponse(
+        response = MarketDataResponse.model_construct(
             status="success",
             message=f"Data retrieved successfully for token {token}",
-            data=market_data,
-            count=len(market_data),
-            last_updated=data_timestamp or datetime.now(IST).replace(tzinfo=None)
+            data=[market_data],
+            count=1,
+            last_updated=market_data.last_updated
         )
+        # Encode in pydantic-core directly; returning the model would re-validate it against response_model
+        return Response(content=response.model_dump_json(), media_type="application/json")
         
     except HTTPException:
         raise
@@ -200,10 +352,6 @@ async def get_token_data(token: str) -> MarketDataResponse:
             status_code=500,
             detail=f"Error fetching token data: {str(e)}"
         )
-    finally:
-        # Only close if not using test connection
-        if 'con' in locals() and con is not test_db_connection:
-            con.close()
 
 if __name__ == "__main__":
     import uvicorn
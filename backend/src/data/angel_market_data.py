@@ -1,33 +1,34 @@
 import os
-import duckdb
-import pytz
+from zoneinfo import ZoneInfo
 from datetime import datetime
 from logzero import logger
 from typing import List, Dict, Any, Optional
 from src.data.token_manager import TokenManager
 
 # Constants
-IST = pytz.timezone('Asia/Kolkata')
+IST = ZoneInfo('Asia/Kolkata')
 MAX_TOKENS_PER_REQUEST = 50
 MARKET_OPEN_TIME = "09:15:00"
 MARKET_CLOSE_TIME = "15:30:00"
 
 class AngelMarketData:
-    def __init__(self, token_manager: TokenManager):
+    def __init__(self, token_manager: TokenManager, connection=None):
         """Initialize the Angel Market Data manager.
         
         Args:
             token_manager (TokenManager): Instance of TokenManager for token operations
+            connection: Optional shared DuckDB connection, defaults to the token manager's
         """
         self.db_file = os.getenv('DB_FILE', 'nfo_data.duckdb')
         self.token_manager = token_manager
+        self.con = connection if connection is not None else token_manager.con
         self.setup_database()
 
     def setup_database(self) -> None:
         """Create the required tables for storing real-time market data"""
         con = None
         try:
-            con = duckdb.connect(self.db_file)
+            con = self.con.cursor()
             
             # Drop existing tables
             con.execute("DROP TABLE IF EXISTS realtime_spot_data")
@@ -159,7 +160,7 @@ class AngelMarketData:
         """
         con = None
         try:
-            con = duckdb.connect(self.db_file)
+            con = self.con.cursor()
             
             # Get tokens based on type
             result = con.execute("""
@@ -209,7 +210,7 @@ class AngelMarketData:
         """
         con = None
         try:
-            con = duckdb.connect(self.db_file)
+            con = self.con.cursor()
             timestamp = datetime.now(IST).replace(tzinfo=None)
             
             # Get token to name mapping
@@ -295,7 +296,7 @@ class AngelMarketData:
         """
         con = None
         try:
-            con = duckdb.connect(self.db_file)
+            con = self.con.cursor()
             timestamp = datetime.now(IST).replace(tzinfo=None)
             
             # Get token to name mapping
@@ -382,7 +383,7 @@ class AngelMarketData:
         """
         con = None
         try:
-            con = duckdb.connect(self.db_file)
+            con = self.con.cursor()
             timestamp = datetime.now(IST).replace(tzinfo=None)
             
             # Get token to name mapping
@@ -556,7 +557,7 @@ class AngelMarketData:
         """
         con = None
         try:
-            con = duckdb.connect(self.db_file)
+            con = self.con.cursor()
             
             # Get all strikes for this stock and expiry, ordered
             logger.info(f"Calculating strike interval for {name} with expiry {expiry}")
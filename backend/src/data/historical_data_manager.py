@@ -1,33 +1,43 @@
 import os
-import duckdb
-import pytz
+from zoneinfo import ZoneInfo
 import pandas as pd
+import pyarrow as pa
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from logzero import logger
 from typing import List, Dict, Any, Optional, Tuple
 from data.token_manager import TokenManager
 
 # Constants
-IST = pytz.timezone('Asia/Kolkata')
+IST = ZoneInfo('Asia/Kolkata')
 SPOT_START_DATE = "1992-01-01"  # Historical start date for spot data
 API_RATE_LIMIT = 1  # 1 request per second as per documentation
 MAX_RETRIES = 3  # Maximum number of API retries
 RETRY_DELAY = 2  # Delay between retries in seconds
+DOWNLOAD_WORKERS = 8  # Concurrent getCandleData calls, still paced by API_RATE_LIMIT
 
 class HistoricalDataManager:
-    def __init__(self, token_manager: TokenManager):
-        """Initialize the HistoricalDataManager with database configuration."""
+    def __init__(self, token_manager: TokenManager, connection=None):
+        """Initialize the HistoricalDataManager with database configuration.
+        
+        Args:
+            token_manager (TokenManager): Instance of TokenManager for token operations
+            connection: Optional shared DuckDB connection, defaults to the token manager's
+        """
         self.db_file = os.getenv('DB_FILE', 'nfo_data.duckdb')
         self.token_manager = token_manager
+        self.con = connection if connection is not None else token_manager.con
         self.setup_database()
         self.last_api_call = 0  # Track last API call time for rate limiting
+        self._rate_lock = threading.Lock()
 
     def setup_database(self) -> None:
         """Create database tables if they don't exist"""
         con = None
         try:
-            con = duckdb.connect(self.db_file)
+            con = self.con.cursor()
             
             # Use standard TIMESTAMP without precision specification
             con.execute("""
@@ -60,7 +70,7 @@ class HistoricalDataManager:
         """Get list of tokens by type from the tokens table"""
         con = None
         try:
-            con = duckdb.connect(self.db_file)
+            con = self.con.cursor()
             
             result = con.execute("""
                 SELECT 
@@ -97,16 +107,17 @@ class HistoricalDataManager:
                 con.close()
 
     def _rate_limit(self):
-        """Implement rate limiting for API calls"""
-        current_time = time.time()
-        time_since_last_call = current_time - self.last_api_call
-        
-        if time_since_last_call < API_RATE_LIMIT:
-            sleep_time = API_RATE_LIMIT - time_since_last_call
-            logger.debug(f"Rate limiting: sleeping for {sleep_time:.2f} seconds")
-            time.sleep(sleep_time)
-        
-        self.last_api_call = time.time()
+        """Implement rate limiting for API calls, shared by all download threads"""
+        with self._rate_lock:
+            current_time = time.time()
+            time_since_last_call = current_time - self.last_api_call
+            
+            if time_since_last_call < API_RATE_LIMIT:
+                sleep_time = API_RATE_LIMIT - time_since_last_call
+                logger.debug(f"Rate limiting: sleeping for {sleep_time:.2f} seconds")
+                time.sleep(sleep_time)
+            
+            self.last_api_call = time.time()
 
     def _get_candle_data_with_retry(self, connector, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Get candle data with retry logic"""
@@ -133,6 +144,61 @@ class HistoricalDataManager:
         
         return None
 
+    def _candles_to_table(self, historical_data: Dict[str, Any], token_info: Dict[str, Any],
+                          download_timestamp: Optional[datetime] = None) -> pa.Table:
+        """Convert getCandleData candles into a historical_data shaped Arrow table.
+        
+        Args:
+            historical_data (Dict[str, Any]): getCandleData response
+            token_info (Dict[str, Any]): Token, symbol, name and token_type of the candles
+            download_timestamp (Optional[datetime]): Batch timestamp, defaults to now
+            
+        Returns:
+            pa.Table: One row per valid candle, in historical_data column order
+        """
+        # Parse and convert every candle column at once; unparseable candles become NaN and are dropped
+        candles = pd.DataFrame(
+            [candle[:6] for candle in historical_data['data']],
+            columns=['ts', 'open', 'high', 'low', 'close', 'volume']
+        )
+        candles['timestamp'] = pd.to_datetime(candles['ts'], utc=True, errors='coerce').dt.tz_convert(IST).dt.tz_localize(None)
+        for column in ('open', 'high', 'low', 'close', 'volume'):
+            candles[column] = pd.to_numeric(candles[column], errors='coerce')
+        
+        valid = candles.drop(columns='ts').notna().all(axis=1)
+        if not valid.all():
+            logger.error(f"Skipped {(~valid).sum()} unparseable candles for {token_info['symbol']}")
+        candles = candles[valid]
+        
+        timestamps = pa.array(candles['timestamp'], pa.timestamp('us'))
+        opens, highs, lows, closes = (pa.array(candles[column], pa.float64()) for column in ('open', 'high', 'low', 'close'))
+        volumes = pa.array(candles['volume'].astype('int64'), pa.int64())
+        
+        num_rows = len(timestamps)
+        download_timestamp = download_timestamp or datetime.now().replace(microsecond=0)
+        return pa.table({
+            'token': pa.array([token_info['token']] * num_rows, pa.string()),
+            'symbol': pa.array([token_info['symbol']] * num_rows, pa.string()),
+            'name': pa.array([token_info['name']] * num_rows, pa.string()),
+            'timestamp': timestamps,
+            'open': opens,
+            'high': highs,
+            'low': lows,
+            'close': closes,
+            'volume': volumes,
+            'oi': pa.array([0] * num_rows, pa.int64()),
+            'token_type': pa.array([token_info['token_type']] * num_rows, pa.string()),
+            'download_timestamp': pa.array([download_timestamp] * num_rows, pa.timestamp('us'))
+        })
+
+    def _write_historical_table(self, con, table: pa.Table) -> None:
+        """Bulk load an Arrow table of candles; re-downloaded candles replace the stored ones by key"""
+        con.register('new_rows', table)
+        try:
+            con.execute("INSERT OR REPLACE INTO historical_data BY NAME SELECT * FROM new_rows")
+        finally:
+            con.unregister('new_rows')
+
     def _store_historical_data(self, historical_data: Dict[str, Any], token_info: Dict[str, Any]) -> bool:
         """Store historical data in the database"""
         con = None
@@ -144,86 +210,25 @@ class HistoricalDataManager:
                 logger.warning("No historical data received for storage")
                 return False
             
-            # Define column names
-            columns = ['token', 'symbol', 'name', 'timestamp', 'open', 'high', 'low', 
-                       'close', 'volume', 'oi', 'token_type', 'download_timestamp']
-            
-            # Store records as strings or primitive types to avoid timestamp conversion issues
-            string_records = []
-            for candle in historical_data['data']:
-                try:
-                    # Parse timestamp 
-                    ts = pd.to_datetime(candle[0])
-                    if ts.tz is None:
-                        ts = ts.tz_localize('UTC')
-                    timestamp = ts.tz_convert(IST).tz_localize(None)
-                    
-                    # Format as string in ISO format
-                    timestamp_str = timestamp.strftime("%Y-%m-%d %H:%M:%S")
-                    
-                    # Convert numeric values
-                    open_price = float(candle[1])
-                    high_price = float(candle[2])
-                    low_price = float(candle[3])
-                    close_price = float(candle[4])
-                    volume = int(candle[5])
-                    
-                    # Add to string records
-                    string_records.append((
-                        token_info['token'],
-                        token_info['symbol'],
-                        token_info['name'],
-                        timestamp_str,  # Use string format
-                        open_price, 
-                        high_price,
-                        low_price,
-                        close_price,
-                        volume,
-                        0,  # oi
-                        token_info['token_type'],
-                        datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Current time as string
-                    ))
-                except Exception as e:
-                    logger.error(f"Error processing candle data: {e}")
-                    continue
-            
-            if string_records:
-                # Create DataFrame with explicit column names
-                df = pd.DataFrame(string_records, columns=columns)
-                
-                # Convert to pandas datetime64 type
-                df['timestamp'] = pd.to_datetime(df['timestamp'], utc=False)
-                df['download_timestamp'] = pd.to_datetime(df['download_timestamp'], utc=False)
-                
-                # Connect to database
-                con = duckdb.connect(self.db_file)
-                
-                # Get date for deletion
-                date_str = pd.to_datetime(df['timestamp'].iloc[0]).strftime("%Y-%m-%d")
-                
-                # Delete existing records
-                con.execute(
-                    "DELETE FROM historical_data WHERE token = ? AND CAST(timestamp AS DATE) = ?",
-                    [token_info['token'], date_str]
-                )
-                
-                # Insert records directly from DataFrame
-                con.execute("INSERT INTO historical_data SELECT * FROM df")
-                
-                # After storing the data, verify what we've stored
-                stored_count = con.execute("""
-                    SELECT COUNT(*), MIN(timestamp)::DATE, MAX(timestamp)::DATE 
-                    FROM historical_data 
-                    WHERE token = ?
-                """, [token_info['token']]).fetchone()
-                
-                logger.info(f"Stored {len(string_records)} records for {token_info['symbol']}. " 
-                           f"DB now has {stored_count[0]} records from {stored_count[1]} to {stored_count[2]}")
-                
-                return True
-            else:
+            table = self._candles_to_table(historical_data, token_info)
+            if not table.num_rows:
                 logger.warning(f"No valid records found for {token_info['symbol']}")
                 return False
+            
+            con = self.con.cursor()
+            self._write_historical_table(con, table)
+            
+            # After storing the data, verify what we've stored
+            stored_count = con.execute("""
+                SELECT COUNT(*), MIN(timestamp)::DATE, MAX(timestamp)::DATE 
+                FROM historical_data 
+                WHERE token = ?
+            """, [token_info['token']]).fetchone()
+            
+            logger.info(f"Stored {table.num_rows} records for {token_info['symbol']}. " 
+                       f"DB now has {stored_count[0]} records from {stored_count[1]} to {stored_count[2]}")
+            
+            return True
                 
         except Exception as e:
             logger.error(f"Storage failed for {token_info['symbol']}: {str(e)}")
@@ -264,100 +269,94 @@ class HistoricalDataManager:
 
     def download_futures_data(self, connector) -> bool:
         """Download current day's futures data"""
-        try:
-            futures_tokens = self.get_tokens_by_type("FUTURES")
-            if not futures_tokens:
-                logger.error("No futures tokens found")
-                return False
-
-            success_count = 0
-            error_count = 0
-            
-            # Get current date in IST
-            current_date = datetime.now(IST)
-            
-            for token_info in futures_tokens:
-                try:
-                    logger.info(f"Fetching futures data for {token_info['symbol']}")
-                    
-                    params = {
-                        "exchange": "NFO",
-                        "symboltoken": token_info['token'],
-                        "interval": "ONE_DAY",
-                        "fromdate": current_date.strftime("%Y-%m-%d 09:00"),
-                        "todate": current_date.strftime("%Y-%m-%d 15:30")
-                    }
-                    
-                    historical_data = self._get_candle_data_with_retry(connector, params)
-                    if historical_data and self._store_historical_data(historical_data, token_info):
-                        success_count += 1
-                    else:
-                        error_count += 1
-                        
-                except Exception as e:
-                    error_count += 1
-                    logger.error(f"Error processing futures data for {token_info['symbol']}: {str(e)}")
-                    continue
-
-            logger.info(f"\nFutures data processing summary:")
-            logger.info(f"- Successfully processed: {success_count}")
-            logger.info(f"- Failed to process: {error_count}")
-            
-            return success_count > 0
-            
-        except Exception as e:
-            logger.error(f"Error in futures data processing: {e}")
-            return False
+        return self._download_current_day_data(connector, "FUTURES")
 
     def download_options_data(self, connector) -> bool:
         """Download current day's options data"""
+        return self._download_current_day_data(connector, "OPTIONS")
+
+    def _download_current_day_data(self, connector, token_type: str) -> bool:
+        """Download current day's NFO candles for every token of a type
+        
+        Args:
+            connector: Authenticated SmartConnect instance
+            token_type (str): FUTURES or OPTIONS
+            
+        Returns:
+            bool: True if at least one token was stored
+        """
+        label = token_type.lower()
         try:
-            options_tokens = self.get_tokens_by_type("OPTIONS")
-            if not options_tokens:
-                logger.error("No options tokens found")
+            tokens = self.get_tokens_by_type(token_type)
+            if not tokens:
+                logger.error(f"No {label} tokens found")
                 return False
 
             success_count = 0
             error_count = 0
+            tables = []
             
             # Get current date in IST
             current_date = datetime.now(IST)
+            download_timestamp = datetime.now().replace(microsecond=0)
+            
+            def fetch(token_info: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+                logger.info(f"Fetching {label} data for {token_info['symbol']}")
+                params = {
+                    "exchange": "NFO",
+                    "symboltoken": token_info['token'],
+                    "interval": "ONE_DAY",
+                    "fromdate": current_date.strftime("%Y-%m-%d 09:00"),
+                    "todate": current_date.strftime("%Y-%m-%d 15:30")
+                }
+                return self._get_candle_data_with_retry(connector, params)
+            
+            # Overlap the API round trips in worker threads; DuckDB writes stay on this thread
+            with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+                futures = {executor.submit(fetch, token_info): token_info for token_info in tokens}
+                for future in as_completed(futures):
+                    token_info = futures[future]
+                    try:
+                        historical_data = future.result()
+                        table = (self._candles_to_table(historical_data, token_info, download_timestamp)
+                                 if historical_data else None)
+                        if table is not None and table.num_rows:
+                            tables.append(table)
+                            success_count += 1
+                        else:
+                            error_count += 1
+                    except Exception as e:
+                        error_count += 1
+                        logger.error(f"Error processing {label} data for {token_info['symbol']}: {str(e)}")
             
-            for token_info in options_tokens:
+            # Store the whole category in one transaction
+            if tables:
+                con = self.con.cursor()
                 try:
-                    logger.info(f"Fetching options data for {token_info['symbol']}")
-                    
-                    params = {
-                        "exchange": "NFO",
-                        "symboltoken": token_info['token'],
-                        "interval": "ONE_DAY",
-                        "fromdate": current_date.strftime("%Y-%m-%d 09:00"),
-                        "todate": current_date.strftime("%Y-%m-%d 15:30")
-                    }
-                    
-                    historical_data = self._get_candle_data_with_retry(connector, params)
-                    if historical_data and self._store_historical_data(historical_data, token_info):
-                        success_count += 1
-                    else:
-                        error_count += 1
-                        
-                except Exception as e:
-                    error_count += 1
-                    logger.error(f"Error processing options data for {token_info['symbol']}: {str(e)}")
-                    continue
+                    con.begin()
+                    try:
+                        self._write_historical_table(con, pa.concat_tables(tables))
+                        con.commit()
+                    except Exception:
+                        con.rollback()
+                        raise
+                finally:
+                    con.close()
+                logger.info(f"Stored {sum(table.num_rows for table in tables)} {label} records for {len(tables)} tokens")
 
-            logger.info(f"\nOptions data processing summary:")
+            logger.info(f"\n{label.capitalize()} data processing summary:")
             logger.info(f"- Successfully processed: {success_count}")
             logger.info(f"- Failed to process: {error_count}")
             
             return success_count > 0
             
         except Exception as e:
-            logger.error(f"Error in options data processing: {e}")
+            logger.error(f"Error in {label} data processing: {e}")
             return False
 
     def fetch_and_store_historical_data(self, connector) -> bool:
         """Main function to fetch and store historical data for all tokens"""
+        con = None
         try:
             # Check if token data is current
             if not self.token_manager.is_market_data_current():
@@ -367,7 +366,7 @@ class HistoricalDataManager:
                     return False
 
             # Get all spot tokens
-            con = duckdb.connect(self.db_file)
+            con = self.con.cursor()
             spot_tokens = con.execute("""
                 SELECT token, symbol, name, exch_seg 
                 FROM tokens 
@@ -379,22 +378,50 @@ class HistoricalDataManager:
             
             success_count = 0
             error_count = 0
+            tables = []
             
-            # Process each token
+            # Read the clock once per batch rather than once per token
+            now = datetime.now(IST)
+            latest_date = self._latest_trading_day(now)
+            prev_day = self._get_previous_trading_day(now.date())
+            download_timestamp = datetime.now().replace(microsecond=0)
+            
+            # Skip tokens whose data is current
+            pending_tokens = []
             for token_info in spot_tokens:
                 token, symbol = token_info[0], token_info[1]
                 logger.debug(f"Processing token_info: {token_info}")
                 
-                # Skip if data is current
-                if self._is_historical_data_current(con, token):
+                if self._is_historical_data_current(con, token, latest_date):
                     logger.info(f"Historical data for {symbol} is current, skipping...")
                     continue
-                    
-                logger.info(f"Fetching historical data for {symbol}")
-                if self._download_token_data(connector, token_info):
-                    success_count += 1
-                else:
-                    error_count += 1
+                pending_tokens.append(token_info)
+            
+            # Overlap the API round trips in worker threads; DuckDB writes stay on this thread
+            with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+                futures = {
+                    executor.submit(self._download_token_data, connector, token_info,
+                                    prev_day, download_timestamp): token_info
+                    for token_info in pending_tokens
+                }
+                for future in as_completed(futures):
+                    table = future.result()
+                    if table is not None and table.num_rows:
+                        tables.append(table)
+                        success_count += 1
+                    else:
+                        error_count += 1
+            
+            # Store every downloaded token in one transaction
+            if tables:
+                con.begin()
+                try:
+                    self._write_historical_table(con, pa.concat_tables(tables))
+                    con.commit()
+                except Exception:
+                    con.rollback()
+                    raise
+                logger.info(f"Stored {sum(table.num_rows for table in tables)} records for {len(tables)} tokens")
                     
             logger.info(f"\nHistorical Data Download Summary:")
             logger.info(f"- Successfully processed: {success_count}")
@@ -410,8 +437,13 @@ class HistoricalDataManager:
             if con:
                 con.close()
 
-    def _download_token_data(self, connector, token_info: Tuple) -> bool:
-        """Download historical data for a single token"""
+    def _download_token_data(self, connector, token_info: Tuple, prev_day=None,
+                             download_timestamp: Optional[datetime] = None) -> Optional[pa.Table]:
+        """Download historical data for a single token
+        
+        Returns:
+            Optional[pa.Table]: Candles ready for historical_data, None if the download failed
+        """
         try:
             # Add detailed logging of token_info
             logger.debug(f"Token info received: {token_info}")
@@ -422,12 +454,9 @@ class HistoricalDataManager:
             
             logger.info(f"Processing token data: token={token}, symbol={symbol}, name={name}, exchange={exchange}")
             
-            # Get previous trading day
-            today = datetime.now(IST).date()
-            if today.year > datetime.now().year:
-                today = datetime.now().date()  # Correct the year if it's in the future
-            
-            prev_day = self._get_previous_trading_day(today)
+            # Get previous trading day, unless the caller already resolved it for the batch
+            if prev_day is None:
+                prev_day = self._get_previous_trading_day(datetime.now(IST).date())
             logger.debug(f"Previous trading day: {prev_day}")
             
             # For technical indicators, we need at least 30-60 days of data
@@ -450,9 +479,9 @@ class HistoricalDataManager:
             historical_data = self._get_candle_data_with_retry(connector, params)
             if not historical_data:
                 logger.error(f"Failed to get historical data for {symbol}")
-                return False
+                return None
             
-            # Convert token_info tuple to dict for _store_historical_data
+            # Convert token_info tuple to dict for _candles_to_table
             token_info_dict = {
                 'token': token,
                 'symbol': symbol,
@@ -464,37 +493,42 @@ class HistoricalDataManager:
             # Validate data before storing
             if 'data' in historical_data and len(historical_data['data']) > 0:
                 logger.debug(f"Retrieved {len(historical_data['data'])} candles for {symbol}")
-                return self._store_historical_data(historical_data, token_info_dict)
+                return self._candles_to_table(historical_data, token_info_dict, download_timestamp)
             else:
                 logger.warning(f"No historical data records found for {symbol}")
-                return False
+                return None
             
         except Exception as e:
             logger.error(f"Error downloading data for {token_info[1]}: {str(e)}")
             logger.exception("Detailed traceback:")
-            return False
+            return None
+
+    def _latest_trading_day(self, now: datetime):
+        """Latest trading day with a complete candle as of ``now`` (IST)"""
+        # If it's before market close time (15:30), we consider previous trading day as latest
+        if now.time() < datetime.strptime("15:30:00", "%H:%M:%S").time():
+            return self._get_previous_trading_day(now.date())
+        return now.date()
 
-    def _is_historical_data_current(self, con, token: str) -> bool:
+    def _is_historical_data_current(self, con, token: str, current_date=None) -> bool:
         """Check if we already have current historical data for this token"""
         try:
             # Get latest trading day (exclude weekends and holidays)
-            now = datetime.now(IST)
-            current_date = now.date()
-            
-            # If it's before market close time (15:30), we consider previous trading day as latest
-            if now.time() < datetime.strptime("15:30:00", "%H:%M:%S").time():
-                current_date = self._get_previous_trading_day(current_date)
+            if current_date is None:
+                current_date = self._latest_trading_day(datetime.now(IST))
             
             # Format date as string for correct comparison
             date_str = current_date.strftime("%Y-%m-%d")
             
-            # Check if we have data for the latest trading day using correct DuckDB syntax
+            # Check if we have data for the latest trading day; a bare timestamp range
+            # (rather than a DATE cast) lets DuckDB use the (token, timestamp) key and min/max pruning
             result = con.execute("""
                 SELECT COUNT(*) 
                 FROM historical_data 
                 WHERE token = ? 
-                AND CAST(timestamp AS DATE) = ?
-            """, [token, date_str]).fetchone()[0]
+                AND timestamp >= ?::TIMESTAMP
+                AND timestamp < ?::TIMESTAMP + INTERVAL 1 DAY
+            """, [token, date_str, date_str]).fetchone()[0]
             
             return result > 0
         except Exception as e:
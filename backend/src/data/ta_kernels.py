@@ -0,0 +1,85 @@
+import numpy as np
+from scipy.signal import lfilter
+from typing import Tuple
+
+def _smooth(x: np.ndarray, alpha: float) -> np.ndarray:
+    """Run the recurrence y[i] = x[i] + (1 - alpha) * y[i-1] as a first-order IIR filter."""
+    return lfilter([1.0], [1.0, -(1.0 - alpha)], x)
+
+def ema(close: np.ndarray, length: int) -> np.ndarray:
+    """Exponential moving average seeded with the SMA of the first `length` values.
+
+    Args:
+        close (np.ndarray): Price series
+        length (int): EMA span
+
+    Returns:
+        np.ndarray: EMA values, NaN for the first `length - 1` rows
+    """
+    result = np.full(len(close), np.nan)
+    if len(close) < length:
+        return result
+
+    alpha = 2.0 / (length + 1)
+    seed = close[:length].mean()
+    result[length - 1] = seed
+    if len(close) > length:
+        result[length:], _ = lfilter(
+            [alpha], [1.0, -(1.0 - alpha)], close[length:], zi=[(1.0 - alpha) * seed]
+        )
+    return result
+
+def rma(values: np.ndarray, length: int) -> np.ndarray:
+    """Wilder's moving average (adjusted EWM with alpha = 1 / length).
+
+    Args:
+        values (np.ndarray): Input series without leading NaNs
+        length (int): Smoothing length
+
+    Returns:
+        np.ndarray: Smoothed values, NaN for the first `length - 1` rows
+    """
+    alpha = 1.0 / length
+    result = _smooth(values, alpha) / _smooth(np.ones(len(values)), alpha)
+    result[:length - 1] = np.nan
+    return result
+
+def rsi(close: np.ndarray, length: int = 14) -> np.ndarray:
+    """Relative Strength Index using Wilder smoothing of gains and losses.
+
+    Args:
+        close (np.ndarray): Price series
+        length (int): RSI period
+
+    Returns:
+        np.ndarray: RSI values in the 0-100 range
+    """
+    result = np.full(len(close), np.nan)
+    if len(close) <= length:
+        return result
+
+    change = np.diff(close)
+    gains = rma(np.where(change > 0, change, 0.0), length)
+    losses = rma(np.where(change < 0, -change, 0.0), length)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result[1:] = 100.0 * gains / (gains + losses)
+    return result
+
+def macd(close: np.ndarray, fast: int = 12, slow: int = 26, signal: int = 9) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """MACD line, signal line and histogram.
+
+    Args:
+        close (np.ndarray): Price series
+        fast (int): Fast EMA span
+        slow (int): Slow EMA span
+        signal (int): Signal EMA span
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: MACD, signal and histogram series
+    """
+    macd_line = ema(close, fast) - ema(close, slow)
+    signal_line = np.full(len(close), np.nan)
+    first_valid = slow - 1
+    if len(close) > first_valid:
+        signal_line[first_valid:] = ema(macd_line[first_valid:], signal)
+    return macd_line, signal_line, macd_line - signal_line
@@ -1,37 +1,76 @@
 import os
+import time
 from datetime import datetime, timedelta
-import duckdb
-import pytz
+from zoneinfo import ZoneInfo
 from logzero import logger
 from typing import List, Dict, Any, Optional
+import numpy as np
 import pandas as pd
-import pandas_ta as ta
+from .ta_kernels import rsi, macd
+from .token_manager import connect_db
 
-IST = pytz.timezone('Asia/Kolkata')
+IST = ZoneInfo('Asia/Kolkata')
+MIN_HISTORY_DAYS = 60  # Minimum candles for meaningful indicators
+# Calendar days re-read before a token's last stored date: covers the 52-week window,
+# 200 sessions for ma_200 and enough warm-up for the RSI/MACD EMAs to converge
+LOOKBACK_DAYS = 730
+# Calendar days before a token's last stored date that are rewritten on every run,
+# so corrected or re-downloaded candles are picked up
+RECOMPUTE_DAYS = 10
+SCHEMA_VERSION = 2  # Bump when the indicator, latest_market_data or daily_summary columns change
 
 class TechnicalIndicatorManager:
-    def __init__(self, test_connection=None):
+    def __init__(self, connection=None):
         """Initialize the Technical Indicator Manager.
         
         Args:
-            test_connection: Optional DuckDB connection for testing
+            connection: Optional shared DuckDB connection, opened from DB_FILE if not given
         """
         self.db_file = os.getenv('DB_FILE', 'nfo_data.duckdb')
-        self.test_connection = test_connection
+        self.export_dir = os.getenv('PARQUET_EXPORT_DIR', os.path.dirname(os.path.abspath(self.db_file)))
+        self._owns_connection = connection is None
+        self.con = connect_db(self.db_file) if connection is None else connection
         self.setup_database()
 
+    def close(self) -> None:
+        """Close the database connection if this manager opened it"""
+        if self._owns_connection:
+            self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def setup_database(self) -> None:
         """Create the technical_indicators table if it doesn't exist"""
         con = None
         try:
-            # Use test connection if provided, otherwise create new connection
-            con = self.test_connection if self.test_connection else duckdb.connect(self.db_file)
+            con = self.con.cursor()
             
-            # Drop existing table to handle schema changes
-            con.execute("DROP TABLE IF EXISTS technical_indicators")
+            # Keep computed history across runs; only rebuild when the schema version changes
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    component VARCHAR PRIMARY KEY,
+                    version INTEGER
+                )
+            """)
+            stored = con.execute(
+                "SELECT version FROM schema_version WHERE component = 'technical_indicators'"
+            ).fetchone()
+            if stored is None or stored[0] != SCHEMA_VERSION:
+                logger.info(f"Migrating technical indicator tables to schema version {SCHEMA_VERSION}")
+                con.execute("DROP TABLE IF EXISTS technical_indicators")
+                con.execute("DROP TABLE IF EXISTS latest_market_data")
+                con.execute("DROP TABLE IF EXISTS daily_summary")
+                con.execute(
+                    "INSERT OR REPLACE INTO schema_version VALUES ('technical_indicators', ?)",
+                    [SCHEMA_VERSION]
+                )
             
             con.execute("""
-                CREATE TABLE technical_indicators (
+                CREATE TABLE IF NOT EXISTS technical_indicators (
                     token VARCHAR,
                     symbol VARCHAR,
                     date DATE,
@@ -54,16 +93,15 @@ class TechnicalIndicatorManager:
                     bb_upper DOUBLE,
                     bb_middle DOUBLE,
                     bb_lower DOUBLE,
-                    breakout_detected BOOLEAN,
-                    calculation_timestamp TIMESTAMP,
+                    breakout_detected ENUM('BREAKOUT', 'BREAKDOWN'),
+                    calculation_timestamp TIMESTAMP DEFAULT (now() AT TIME ZONE 'Asia/Kolkata'),
                     PRIMARY KEY (token, date)
                 )
             """)
             
             # Create latest market data table
-            con.execute("DROP TABLE IF EXISTS latest_market_data")
             con.execute("""
-                CREATE TABLE latest_market_data (
+                CREATE TABLE IF NOT EXISTS latest_market_data (
                     token VARCHAR PRIMARY KEY,
                     symbol VARCHAR,
                     name VARCHAR,
@@ -96,7 +134,7 @@ class TechnicalIndicatorManager:
                     bb_upper DOUBLE,
                     bb_middle DOUBLE,
                     bb_lower DOUBLE,
-                    breakout_detected VARCHAR,  -- 'BREAKOUT', 'BREAKDOWN', or NULL
+                    breakout_detected ENUM('BREAKOUT', 'BREAKDOWN'),  -- NULL when there is no signal
                     last_updated TIMESTAMP
                 )
             """)
@@ -134,7 +172,7 @@ class TechnicalIndicatorManager:
                     bb_upper DOUBLE,
                     bb_middle DOUBLE,
                     bb_lower DOUBLE,
-                    breakout_detected VARCHAR,
+                    breakout_detected ENUM('BREAKOUT', 'BREAKDOWN'),
                     last_updated TIMESTAMP
                 )
             """)
@@ -144,40 +182,28 @@ class TechnicalIndicatorManager:
             logger.error(f"Error setting up database tables: {e}")
             raise
         finally:
-            # Only close if we created a new connection
-            if con and not self.test_connection:
+            if con:
                 con.close()
 
     def update_latest_market_data(self) -> bool:
         """Update the latest market data table with most recent data"""
         con = None
         try:
-            con = duckdb.connect(self.db_file)
+            con = self.con.cursor()
             
             # Get the latest data for each token
             con.execute("""
                 -- First clear existing data
                 DELETE FROM latest_market_data;
                 
-                -- Insert latest data
-                WITH latest_dates AS (
-                    -- Get the latest date for each token
-                    SELECT 
-                        token,
-                        MAX(date) as latest_date
+                -- Insert latest data: one window pass picks each token's latest indicator row,
+                -- and the matching candle is a range probe on the (token, timestamp) key
+                WITH latest_technical AS (
+                    SELECT *
                     FROM technical_indicators
-                    GROUP BY token
-                ),
-                latest_technical AS (
-                    -- Get latest technical indicators
-                    SELECT t.*
-                    FROM technical_indicators t
-                    INNER JOIN latest_dates ld 
-                        ON t.token = ld.token 
-                        AND t.date = ld.latest_date
+                    QUALIFY ROW_NUMBER() OVER (PARTITION BY token ORDER BY date DESC) = 1
                 ),
                 latest_historical AS (
-                    -- Get latest historical data
                     SELECT 
                         h.token,
                         h.open,
@@ -186,9 +212,10 @@ class TechnicalIndicatorManager:
                         h.close,
                         h.volume
                     FROM historical_data h
-                    INNER JOIN latest_dates ld 
-                        ON h.token = ld.token 
-                        AND h.timestamp::DATE = ld.latest_date
+                    INNER JOIN latest_technical lt 
+                        ON h.token = lt.token 
+                        AND h.timestamp >= lt.date
+                        AND h.timestamp < lt.date + INTERVAL 1 DAY
                 )
                 INSERT INTO latest_market_data
                 SELECT 
@@ -225,11 +252,13 @@ class TechnicalIndicatorManager:
                     t.bb_middle,
                     t.bb_lower,
                     t.breakout_detected,
-                    NOW() as last_updated
+                    now() AT TIME ZONE 'Asia/Kolkata' as last_updated
                 FROM latest_technical t
                 INNER JOIN latest_historical h ON t.token = h.token
                 INNER JOIN tokens tok ON t.token = tok.token
                 WHERE tok.token_type = 'SPOT'
+                -- Cluster by token so point lookups can prune on min/max statistics
+                ORDER BY t.token
             """)
             
             # Verify the update
@@ -237,7 +266,7 @@ class TechnicalIndicatorManager:
                 SELECT 
                     COUNT(*) as record_count,
                     MIN(date) as data_date,
-                    COUNT(CASE WHEN breakout_detected THEN 1 END) as breakouts
+                    COUNT(breakout_detected) as breakouts
                 FROM latest_market_data
             """).fetchone()
             
@@ -246,6 +275,7 @@ class TechnicalIndicatorManager:
             logger.info(f"- Date: {result[1]}")
             logger.info(f"- Breakout signals: {result[2]}")
             
+            self._export_parquet(con, 'latest_market_data')
             return True
             
         except Exception as e:
@@ -255,138 +285,114 @@ class TechnicalIndicatorManager:
             if con:
                 con.close()
 
-    def _get_historical_data(self, token: str) -> Optional[pd.DataFrame]:
-        """Get historical data for a token and prepare it for technical analysis"""
-        con = None
-        try:
-            con = duckdb.connect(self.db_file)
-            current_date = datetime.now(IST).date()
-            
-            # Get data excluding current date
-            df = con.execute("""
-                SELECT 
-                    token,
-                    symbol,
-                    timestamp::DATE as date,
-                    open,
-                    high,
-                    low,
-                    close,
-                    volume
-                FROM historical_data
-                WHERE token = ?
-                AND timestamp::DATE < ?
-                ORDER BY timestamp ASC
-            """, [token, current_date]).df()
-            
-            if df.empty:
-                logger.warning(f"No historical data found for token {token}")
-                return None
-            
-            return df
+    def _export_parquet(self, con, table: str) -> str:
+        """Export a read-mostly dashboard table as a Parquet snapshot.
+        
+        The file is written next to the final path and swapped in atomically so
+        readers never observe a partially written snapshot.
+        
+        Args:
+            con: Open DuckDB connection
+            table (str): Name of the table to export
             
-        except Exception as e:
-            logger.error(f"Error getting historical data for token {token}: {e}")
-            return None
-        finally:
-            if con:
-                con.close()
+        Returns:
+            str: Path of the exported Parquet file
+        """
+        os.makedirs(self.export_dir, exist_ok=True)
+        path = os.path.join(self.export_dir, f"{table}.parquet")
+        tmp_path = f"{path}.tmp"
+        con.execute(f"""
+            COPY {table} TO '{tmp_path.replace("'", "''")}'
+            (FORMAT PARQUET, COMPRESSION ZSTD, ROW_GROUP_SIZE 100000)
+        """)
+        os.replace(tmp_path, path)
+        logger.info(f"Exported {table} to {path}")
+        return path
 
-    def calculate_indicators(self, token: str) -> bool:
-        """Calculate technical indicators for a token."""
-        con = None
+    def _load_candles(self, con, token: Optional[str] = None,
+                      tokens: Optional[List[str]] = None) -> pd.DataFrame:
+        """Read daily SPOT candles sorted by token and date.
+        
+        Tokens that already have indicators only get the last LOOKBACK_DAYS
+        before their latest stored date; all-time high/low are taken over the
+        full history before that cut.
+        
+        Args:
+            con: Open DuckDB cursor
+            token (Optional[str]): Single token to read, every SPOT token with
+                enough history if omitted
+            tokens (Optional[List[str]]): Restrict the SPOT tokens read when
+                token is omitted
+            
+        Returns:
+            pd.DataFrame: token, symbol, date, OHLCV, ath and atl columns
+        """
+        if token is not None:
+            token_filter, history_filter, params = "h.token = ?", "", [token]
+        else:
+            token_filter, params = "t.token_type = 'SPOT'", []
+            history_filter = f"COUNT(*) OVER (PARTITION BY h.token) >= {MIN_HISTORY_DAYS} AND"
+            if tokens is not None:
+                token_filter, params = f"{token_filter} AND h.token = ANY(?)", [list(tokens)]
+        
+        return con.execute(f"""
+            WITH stored AS (
+                SELECT token, MAX(date) as last_date
+                FROM technical_indicators
+                GROUP BY token
+            )
+            SELECT 
+                h.token,
+                t.symbol,
+                CAST(h.timestamp AS DATE) as date,
+                h.open,
+                h.high,
+                h.low,
+                h.close,
+                h.volume,
+                MAX(h.close) OVER (PARTITION BY h.token) as ath,
+                MIN(h.close) OVER (PARTITION BY h.token) as atl
+            FROM historical_data h
+            JOIN tokens t ON h.token = t.token
+            LEFT JOIN stored s ON h.token = s.token
+            WHERE {token_filter}
+            QUALIFY {history_filter}
+                (s.last_date IS NULL OR h.timestamp >= s.last_date - INTERVAL {LOOKBACK_DAYS} DAY)
+            ORDER BY h.token, h.timestamp
+        """, params).df()
+
+    def _add_kernel_indicators(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Add RSI and MACD to candles sorted by token and date.
+        
+        They are recursive EMAs, so they run in the vectorized kernels once per
+        token slice; everything else is a window function in _insert_indicators.
+        """
+        close = df['close'].to_numpy(dtype=np.float64)
+        tokens = df['token'].to_numpy()
+        rsi_14, macd_line, macd_signal, macd_hist = (np.full(len(df), np.nan) for _ in range(4))
+        
+        starts = np.flatnonzero(np.r_[True, tokens[1:] != tokens[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], len(df)]):
+            rsi_14[start:end] = rsi(close[start:end], length=14)
+            macd_line[start:end], macd_signal[start:end], macd_hist[start:end] = macd(
+                close[start:end], fast=12, slow=26, signal=9
+            )
+        
+        return df.assign(rsi_14=rsi_14, macd=macd_line, macd_signal=macd_signal, macd_hist=macd_hist)
+
+    def _insert_indicators(self, con, df: pd.DataFrame) -> int:
+        """Compute the window indicators for every token in df and store the recent dates.
+        
+        Every window is partitioned by token, so one statement covers one token
+        or the whole universe. Windows still see the full history in df, but only
+        dates from RECOMPUTE_DAYS before a token's last stored row are written.
+        
+        Returns:
+            int: Number of rows written
+        """
+        con.register('indicator_data', df)
         try:
-            con = duckdb.connect(self.db_file)
-            
-            # First check if we have enough data for this token
-            data_check = con.execute("""
-                SELECT COUNT(*) as count
-                FROM historical_data 
-                WHERE token = ?
-            """, [token]).fetchone()
-            
-            if not data_check or data_check[0] < 60:  # Need at least 60 days for proper indicators
-                logger.warning(f"Insufficient historical data for token {token}: {data_check[0] if data_check else 0} records")
-                return False
-            
-            # Create temp table with historical data
-            con.execute("""
-                CREATE TEMPORARY TABLE temp_data AS
-                SELECT 
-                    h.token,
-                    t.symbol,
-                    CAST(h.timestamp AS DATE) as date,  # Use explicit CAST
-                    h.open,
-                    h.high,
-                    h.low,
-                    h.close,
-                    h.volume
-                FROM historical_data h
-                JOIN tokens t ON h.token = t.token
-                WHERE h.token = ?
-                ORDER BY h.timestamp
-            """, [token])
-            
-            # Verify temp table has data
-            temp_check = con.execute("SELECT COUNT(*) FROM temp_data").fetchone()
-            if not temp_check or temp_check[0] == 0:
-                logger.error(f"No data in temp table for token {token}")
-                return False
-            
-            # Calculate indicators individually for better control
-            # Moving Averages
-            df = con.execute("""
-                SELECT 
-                    token,
-                    symbol,
-                    date,
-                    close,
-                    volume,
-                    ma_200,
-                    ma_50,
-                    ma_20,
-                    rsi_14,
-                    macd,
-                    macd_signal,
-                    macd_hist,
-                    bb_upper,
-                    bb_middle,
-                    bb_lower,
-                    high_21d,
-                    low_21d,
-                    high_52w,
-                    low_52w,
-                    ath,
-                    atl
-                FROM temp_data
-            """).df()
-            
-            if df.empty:
-                logger.error(f"No data in temp_data for token {token}")
-                return False
-            
-            # Calculate indicators
-            df['ma_200'] = ta.sma(df['close'], length=200)
-            df['ma_50'] = ta.sma(df['close'], length=50)
-            df['ma_20'] = ta.sma(df['close'], length=20)
-            
-            # RSI
-            df['rsi_14'] = ta.rsi(df['close'], length=14)
-            
-            # MACD
-            macd = ta.macd(df['close'], fast=12, slow=26, signal=9)
-            df['macd'] = macd['MACD_12_26_9']
-            df['macd_signal'] = macd['MACDs_12_26_9']
-            df['macd_hist'] = macd['MACDh_12_26_9']
-            
-            # Bollinger Bands
-            bbands = ta.bbands(df['close'], length=20, std=2)
-            df['bb_upper'] = bbands['BBU_20_2.0']
-            df['bb_middle'] = bbands['BBM_20_2.0']
-            df['bb_lower'] = bbands['BBL_20_2.0']
-            
-            # Calculate additional metrics using DuckDB
-            con.execute("""
+            return con.execute(f"""
                 WITH price_levels AS (
                     SELECT 
                         token,
@@ -394,47 +400,96 @@ class TechnicalIndicatorManager:
                         date,
                         close,
                         volume,
-                        ma_200,
-                        ma_50,
-                        ma_20,
+                        -- Simple moving averages, NULL until the full window is available
+                        CASE WHEN COUNT(close) OVER (
+                            PARTITION BY token
+                            ORDER BY date ASC
+                            ROWS BETWEEN 199 PRECEDING AND CURRENT ROW
+                        ) = 200 THEN AVG(close) OVER (
+                            PARTITION BY token
+                            ORDER BY date ASC
+                            ROWS BETWEEN 199 PRECEDING AND CURRENT ROW
+                        ) END as ma_200,
+                        CASE WHEN COUNT(close) OVER (
+                            PARTITION BY token
+                            ORDER BY date ASC
+                            ROWS BETWEEN 49 PRECEDING AND CURRENT ROW
+                        ) = 50 THEN AVG(close) OVER (
+                            PARTITION BY token
+                            ORDER BY date ASC
+                            ROWS BETWEEN 49 PRECEDING AND CURRENT ROW
+                        ) END as ma_50,
+                        CASE WHEN COUNT(close) OVER (
+                            PARTITION BY token
+                            ORDER BY date ASC
+                            ROWS BETWEEN 19 PRECEDING AND CURRENT ROW
+                        ) = 20 THEN AVG(close) OVER (
+                            PARTITION BY token
+                            ORDER BY date ASC
+                            ROWS BETWEEN 19 PRECEDING AND CURRENT ROW
+                        ) END as ma_20,
                         rsi_14,
                         macd,
                         macd_signal,
                         macd_hist,
-                        bb_upper,
-                        bb_middle,
-                        bb_lower,
+                        -- Bollinger Bands (20, 2), population stddev
+                        AVG(close) OVER (
+                            PARTITION BY token
+                            ORDER BY date ASC
+                            ROWS BETWEEN 19 PRECEDING AND CURRENT ROW
+                        ) as bb_middle,
+                        STDDEV_POP(close) OVER (
+                            PARTITION BY token
+                            ORDER BY date ASC
+                            ROWS BETWEEN 19 PRECEDING AND CURRENT ROW
+                        ) as bb_std,
                         MAX(close) OVER (
+                            PARTITION BY token
                             ORDER BY date ASC
                             ROWS BETWEEN 20 PRECEDING AND CURRENT ROW
                         ) as high_21d,
                         MIN(close) OVER (
+                            PARTITION BY token
                             ORDER BY date ASC
                             ROWS BETWEEN 20 PRECEDING AND CURRENT ROW
                         ) as low_21d,
+                        -- 52-week range over calendar days, so holidays and gaps don't stretch it
                         MAX(close) OVER (
+                            PARTITION BY token
                             ORDER BY date ASC
-                            ROWS BETWEEN 364 PRECEDING AND CURRENT ROW
+                            RANGE BETWEEN INTERVAL 365 DAY PRECEDING AND CURRENT ROW
                         ) as high_52w,
                         MIN(close) OVER (
+                            PARTITION BY token
                             ORDER BY date ASC
-                            ROWS BETWEEN 364 PRECEDING AND CURRENT ROW
+                            RANGE BETWEEN INTERVAL 365 DAY PRECEDING AND CURRENT ROW
                         ) as low_52w,
-                        MAX(close) OVER () as ath,
-                        MIN(close) OVER () as atl
-                    FROM temp_data
+                        ath,
+                        atl
+                    FROM indicator_data
+                ),
+                stored AS (
+                    SELECT token, MAX(date) as last_date
+                    FROM technical_indicators
+                    GROUP BY token
                 ),
                 volume_analysis AS (
                     SELECT 
                         *,
                         AVG(volume) OVER (
+                            PARTITION BY token
                             ORDER BY date ASC
                             ROWS BETWEEN 14 PRECEDING AND CURRENT ROW
                         ) as volume_15d_avg,
-                        volume / NULLIF(LAG(volume) OVER (ORDER BY date), 0) as volume_ratio
+                        volume / NULLIF(LAG(volume) OVER (PARTITION BY token ORDER BY date), 0) as volume_ratio
                     FROM price_levels
                 )
-                INSERT INTO technical_indicators
+                INSERT OR REPLACE INTO technical_indicators (
+                    token, symbol, date, ma_200, ma_50, ma_20, ma_200_distance,
+                    high_21d, low_21d, high_52w, low_52w, ath, atl,
+                    volume_15d_avg, volume_ratio, rsi_14, macd, macd_signal, macd_hist,
+                    bb_upper, bb_middle, bb_lower, breakout_detected, calculation_timestamp
+                )
                 SELECT 
                     token,
                     symbol,
@@ -455,9 +510,9 @@ class TechnicalIndicatorManager:
                     macd,
                     macd_signal,
                     macd_hist,
-                    bb_upper,
+                    bb_middle + 2 * bb_std as bb_upper,
                     bb_middle,
-                    bb_lower,
+                    bb_middle - 2 * bb_std as bb_lower,
                     -- Calculate breakout/breakdown detection
                     CASE 
                         WHEN volume > 2 * volume_15d_avg 
@@ -470,10 +525,28 @@ class TechnicalIndicatorManager:
                         THEN 'BREAKDOWN'
                         ELSE NULL
                     END as breakout_detected,
-                    ? as calculation_timestamp
+                    -- Rewritten rows keep their old value otherwise
+                    now() AT TIME ZONE 'Asia/Kolkata' as calculation_timestamp
                 FROM volume_analysis
+                LEFT JOIN stored USING (token)
                 WHERE ma_200 IS NOT NULL
-            """, [datetime.now(IST).replace(tzinfo=None)])
+                AND (stored.last_date IS NULL OR date > stored.last_date - INTERVAL {RECOMPUTE_DAYS} DAY)
+            """).fetchone()[0]
+        finally:
+            con.unregister('indicator_data')
+
+    def calculate_indicators(self, token: str) -> bool:
+        """Calculate technical indicators for a token."""
+        con = None
+        try:
+            con = self.con.cursor()
+            
+            df = self._load_candles(con, token)
+            if len(df) < MIN_HISTORY_DAYS:  # Need at least 60 days for proper indicators
+                logger.warning(f"Insufficient historical data for token {token}: {len(df)} records")
+                return False
+            
+            inserted = self._insert_indicators(con, self._add_kernel_indicators(df))
             
             # Verify calculations
             result = con.execute("""
@@ -482,7 +555,7 @@ class TechnicalIndicatorManager:
                 WHERE token = ?
             """, [token]).fetchone()
             
-            logger.info(f"Calculated indicators for token {token}: {result[0]} records")
+            logger.debug(f"Calculated indicators for token {token}: {inserted} new, {result[0]} records")
             return True
             
         except Exception as e:
@@ -490,14 +563,13 @@ class TechnicalIndicatorManager:
             return False
         finally:
             if con:
-                con.execute("DROP TABLE IF EXISTS temp_data")
                 con.close()
 
     def get_latest_indicators(self, token: str) -> Optional[Dict[str, Any]]:
         """Get the latest technical indicators for a token."""
         con = None
         try:
-            con = duckdb.connect(self.db_file)
+            con = self.con.cursor()
             result = con.execute("""
                 SELECT *
                 FROM technical_indicators
@@ -518,47 +590,75 @@ class TechnicalIndicatorManager:
             if con:
                 con.close()
 
-    def calculate_all_indicators(self) -> bool:
-        """Calculate technical indicators for all tokens."""
+    def get_latest_indicators_many(self, tokens: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get the latest technical indicators for several tokens in one query.
+        
+        Args:
+            tokens (List[str]): Tokens to look up
+            
+        Returns:
+            Dict[str, Dict[str, Any]]: Latest indicator row per token; tokens
+                without indicators are left out
+        """
         con = None
         try:
-            con = duckdb.connect(self.db_file)
+            con = self.con.cursor()
+            result = con.execute("""
+                SELECT *
+                FROM technical_indicators
+                WHERE token = ANY(?)
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY token ORDER BY date DESC) = 1
+            """, [list(tokens)]).fetchall()
+            
+            column_names = [desc[0] for desc in con.description]
+            return {row[0]: dict(zip(column_names, row)) for row in result}
             
-            # Get unique spot tokens
-            tokens = con.execute("""
-                SELECT DISTINCT h.token
-                FROM historical_data h
-                JOIN tokens t ON h.token = t.token
-                WHERE t.token_type = 'SPOT'
-            """).fetchall()
+        except Exception as e:
+            logger.error(f"Error getting indicators for {len(tokens)} tokens: {e}")
+            return {}
+        finally:
+            if con:
+                con.close()
+
+    def calculate_all_indicators(self, tokens: Optional[List[str]] = None) -> bool:
+        """Calculate technical indicators for all SPOT tokens in one pass.
+        
+        One read of historical_data, one kernel pass per token slice and one
+        INSERT with token-partitioned windows, all in a single transaction.
+        
+        The whole table is then exported as a Parquet snapshot for scans from
+        other processes.
+        
+        Args:
+            tokens (Optional[List[str]]): Only calculate these SPOT tokens
+        """
+        con = None
+        try:
+            con = self.con.cursor()
+            start_time = time.time()
             
-            if not tokens:
+            df = self._load_candles(con, tokens=tokens)
+            if df.empty:
                 logger.error("No spot tokens found for technical indicator calculation")
                 return False
             
-            logger.info(f"Found {len(tokens)} spot tokens for technical analysis")
+            token_count = df['token'].nunique()
+            logger.info(f"Found {token_count} spot tokens for technical analysis")
             
-            success_count = 0
-            error_count = 0
+            df = self._add_kernel_indicators(df)
+            con.begin()
+            try:
+                inserted = self._insert_indicators(con, df)
+                con.commit()
+            except Exception:
+                con.rollback()
+                raise
             
-            for token_row in tokens:
-                token = token_row[0]
-                try:
-                    if self.calculate_indicators(token):
-                        success_count += 1
-                        logger.info(f"Successfully calculated indicators for token: {token}")
-                    else:
-                        error_count += 1
-                        logger.error(f"Failed to calculate indicators for token: {token}")
-                except Exception as e:
-                    error_count += 1
-                    logger.error(f"Error calculating indicators for token {token}: {e}")
+            elapsed = time.time() - start_time
+            logger.info(f"Calculated indicators for {token_count} tokens ({inserted} new rows) in {elapsed:.1f}s")
             
-            logger.info(f"\nTechnical Indicators Calculation Summary:")
-            logger.info(f"- Successfully processed: {success_count}")
-            logger.info(f"- Failed to process: {error_count}")
-            
-            return success_count > 0
+            self._export_parquet(con, 'technical_indicators')
+            return True
             
         except Exception as e:
             logger.error(f"Error calculating all indicators: {e}")
@@ -571,7 +671,7 @@ class TechnicalIndicatorManager:
         """Update the daily summary table with latest technical indicators and price data"""
         con = None
         try:
-            con = duckdb.connect(self.db_file)
+            con = self.con.cursor()
             current_date = datetime.now(IST).date()
             
             # Update daily summary table
@@ -614,7 +714,7 @@ class TechnicalIndicatorManager:
                         ti.bb_middle,
                         ti.bb_lower,
                         ti.breakout_detected,
-                        NOW() as last_updated,
+                        now() AT TIME ZONE 'Asia/Kolkata' as last_updated,
                         ROW_NUMBER() OVER (
                             PARTITION BY h.token 
                             ORDER BY h.timestamp DESC
@@ -665,7 +765,7 @@ class TechnicalIndicatorManager:
             result = con.execute("""
                 SELECT 
                     COUNT(*) as record_count,
-                    COUNT(CASE WHEN breakout_detected IS NOT NULL THEN 1 END) as breakouts
+                    COUNT(breakout_detected) as breakouts
                 FROM daily_summary
             """).fetchone()
             
@@ -673,6 +773,7 @@ class TechnicalIndicatorManager:
             logger.info(f"- Total records: {result[0]}")
             logger.info(f"- Breakout signals: {result[1]}")
             
+            self._export_parquet(con, 'daily_summary')
             return True
             
         except Exception as e:
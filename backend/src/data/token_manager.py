@@ -1,36 +1,86 @@
 import os
 import requests
 import duckdb
-import pytz
-import pandas as pd
-from datetime import datetime
+from zoneinfo import ZoneInfo
+from datetime import datetime, time, timedelta
 from logzero import logger
 from typing import List, Dict, Any, Optional
 
 # Constants
 ANGEL_API_URL = "https://margincalculator.angelbroking.com/OpenAPI_File/files/OpenAPIScripMaster.json"
-IST = pytz.timezone('Asia/Kolkata')
-MARKET_OPEN_TIME = "09:15:00"
+IST = ZoneInfo('Asia/Kolkata')
+MARKET_OPEN_TIME = time(9, 15)
+SCRIP_CACHE_MAX_AGE = timedelta(hours=6)  # Cached scrip master is reused without revalidation within this age
+TOKEN_TYPE_ENUM = "ENUM('SPOT', 'FUTURES', 'OPTIONS')"
+TOKENS_SCHEMA_VERSION = 1  # Bump with a migration in setup_database when the tokens columns change
+# Scrip master fields, all read as text and cast where needed
+SCRIP_MASTER_COLUMNS = {
+    'token': 'VARCHAR',
+    'symbol': 'VARCHAR',
+    'name': 'VARCHAR',
+    'expiry': 'VARCHAR',
+    'strike': 'VARCHAR',
+    'lotsize': 'VARCHAR',
+    'instrumenttype': 'VARCHAR',
+    'exch_seg': 'VARCHAR',
+    'tick_size': 'VARCHAR',
+}
+
+# Optional DuckDB settings, applied to every connection opened through connect_db
+DUCKDB_SETTINGS = {
+    'threads': 'DUCKDB_THREADS',
+    'memory_limit': 'DUCKDB_MEMORY_LIMIT',
+    'temp_directory': 'DUCKDB_TEMP_DIRECTORY',
+}
+
+def connect_db(db_file: str) -> duckdb.DuckDBPyConnection:
+    """Open the database file and apply the DUCKDB_* overrides from the environment.
+    
+    Settings are applied with SET rather than a connect-time config, so other
+    plain duckdb.connect calls on the same file in this process still succeed.
+    
+    Args:
+        db_file (str): Path of the DuckDB database file
+        
+    Returns:
+        duckdb.DuckDBPyConnection: Open connection
+    """
+    con = duckdb.connect(db_file)
+    con.execute("SET enable_object_cache = true")
+    for setting, env_var in DUCKDB_SETTINGS.items():
+        value = os.getenv(env_var)
+        if value:
+            con.execute(f"SET {setting} = '{value.replace(chr(39), chr(39) * 2)}'")
+    return con
 
 class TokenManager:
-    def __init__(self):
-        """Initialize the TokenManager with database configuration."""
+    def __init__(self, connection=None):
+        """Initialize the TokenManager with database configuration.
+        
+        Args:
+            connection: Optional shared DuckDB connection, opened from DB_FILE if not given
+        """
         self.db_file = os.getenv('DB_FILE', 'nfo_data.duckdb')
+        self.cache_dir = os.getenv('SCRIP_CACHE_DIR', os.path.dirname(os.path.abspath(self.db_file)))
+        self.scrip_file = os.path.join(self.cache_dir, 'scrip_master.json')
+        self.scrip_parquet = os.path.join(self.cache_dir, 'scrip_master.parquet')
+        self.export_dir = os.getenv('PARQUET_EXPORT_DIR', os.path.dirname(os.path.abspath(self.db_file)))
+        self._owns_connection = connection is None
+        self.con = connect_db(self.db_file) if connection is None else connection
         self.setup_database()
 
     def setup_database(self) -> None:
         """Create the tokens table if it doesn't exist"""
         con = None
         try:
-            # Create new connection and table
-            con = duckdb.connect(self.db_file)
+            con = self.con.cursor()
             
             # Check if table exists instead of dropping it
             table_exists = con.execute("SELECT count(*) FROM information_schema.tables WHERE table_name = 'tokens'").fetchone()[0] > 0
             
             # Only create if it doesn't exist
             if not table_exists:
-                con.execute("""
+                con.execute(f"""
                     CREATE TABLE tokens (
                         token VARCHAR,
                         symbol VARCHAR,
@@ -42,13 +92,44 @@ class TokenManager:
                         instrumenttype VARCHAR,
                         exch_seg VARCHAR,
                         tick_size DOUBLE,
-                        token_type VARCHAR,  -- 'SPOT', 'FUTURES', or 'OPTIONS'
-                        download_timestamp TIMESTAMP
+                        token_type {TOKEN_TYPE_ENUM},
+                        download_timestamp TIMESTAMP,
+                        expiry_date DATE
                     )
                 """)
                 logger.info("Tokens table created successfully")
             else:
                 logger.info("Tokens table already exists")
+                # Tables created before expiry_date was stored get it on the next refresh
+                con.execute("ALTER TABLE tokens ADD COLUMN IF NOT EXISTS expiry_date DATE")
+            
+            # Migrate existing tables in place, so stored tokens survive a schema change
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    component VARCHAR PRIMARY KEY,
+                    version INTEGER
+                )
+            """)
+            stored = con.execute("SELECT version FROM schema_version WHERE component = 'tokens'").fetchone()
+            if stored is None or stored[0] != TOKENS_SCHEMA_VERSION:
+                if table_exists:
+                    # Version 1: token_type was VARCHAR before it became an ENUM
+                    logger.info(f"Migrating tokens table to schema version {TOKENS_SCHEMA_VERSION}")
+                    con.execute(f"ALTER TABLE tokens ALTER COLUMN token_type TYPE {TOKEN_TYPE_ENUM}")
+                con.execute(
+                    "INSERT OR REPLACE INTO schema_version VALUES ('tokens', ?)",
+                    [TOKENS_SCHEMA_VERSION]
+                )
+            
+            # Validators of the cached scrip master for conditional downloads
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS scrip_meta (
+                    url VARCHAR PRIMARY KEY,
+                    etag VARCHAR,
+                    last_modified VARCHAR,
+                    fetched_at TIMESTAMP
+                )
+            """)
         except Exception as e:
             logger.error(f"Error setting up database: {e}")
             raise
@@ -58,10 +139,11 @@ class TokenManager:
 
     def is_market_data_current(self) -> bool:
         """Check if we already have current market data"""
+        con = None
         try:
-            con = duckdb.connect(self.db_file)
+            con = self.con.cursor()
             
-            logger.info(f"Checking if market data is current in database: {self.db_file}")
+            logger.debug(f"Checking if market data is current in database: {self.db_file}")
             
             result = con.execute("""
                 SELECT MAX(download_timestamp) as last_download,
@@ -70,24 +152,15 @@ class TokenManager:
             """).fetchone()
             
             if result[0] is None:
-                logger.info("No existing records found in database")
+                logger.debug("No existing records found in database")
                 return False
                 
             last_download = result[0]
             total_records = result[1]
-            logger.info(f"Found {total_records} records with last download at {last_download}")
-            
-            current_date = datetime.now(IST).replace(tzinfo=None).date()
-            market_open_time = datetime.strptime(
-                f"{current_date} {MARKET_OPEN_TIME}", 
-                "%Y-%m-%d %H:%M:%S"
-            )
+            logger.debug(f"Found {total_records} records with last download at {last_download}")
             
-            logger.info(f"Current date: {current_date}")
-            logger.info(f"Market open time: {market_open_time}")
-            logger.info(f"Last download date: {last_download.date()}")
-            logger.info(f"Is last download same as current date? {last_download.date() == current_date}")
-            logger.info(f"Is last download after market open? {last_download >= market_open_time}")
+            current_date = datetime.now(IST).date()
+            market_open_time = datetime.combine(current_date, MARKET_OPEN_TIME)
             
             is_current = (last_download.date() == current_date and last_download >= market_open_time)
             logger.info(f"Is market data current? {is_current}")
@@ -95,149 +168,277 @@ class TokenManager:
             return is_current
             
         except Exception as e:
-            logger.error(f"Error checking if market data is current: {e}")
-            # Print stack trace for debugging
-            import traceback
-            logger.error(traceback.format_exc())
+            logger.exception(f"Error checking if market data is current: {e}")
             return False
         finally:
             if con:
                 con.close()
 
-    def download_and_store_tokens(self) -> bool:
+    def _download_scrip_master(self, con, force_refresh: bool = False) -> str:
+        """Download the scrip master to the cache file unless it is unchanged.
+        
+        A copy fetched within SCRIP_CACHE_MAX_AGE on the same IST day is used
+        as is, unless the market has opened since it was fetched. Other copies
+        are checked with a HEAD request for their ETag/Last-Modified first,
+        then a conditional GET streams the body to disk only when the server
+        returns a new version.
+        
+        Args:
+            con: DuckDB connection holding the scrip_meta table
+            force_refresh (bool): Skip the cache and download unconditionally
+            
+        Returns:
+            str: Path of the local scrip master Parquet file
+        """
+        headers = {}
+        meta = con.execute(
+            "SELECT etag, last_modified, fetched_at FROM scrip_meta WHERE url = ?", [ANGEL_API_URL]
+        ).fetchone()
+        if meta and os.path.exists(self.scrip_file) and not force_refresh:
+            now = datetime.now(IST).replace(tzinfo=None)
+            # A pre-open copy must not pass for the post-open refresh once the market is open
+            market_open = datetime.combine(now.date(), MARKET_OPEN_TIME)
+            fetched_at = meta[2]
+            if (fetched_at and fetched_at.date() == now.date() and now - fetched_at < SCRIP_CACHE_MAX_AGE
+                    and (now < market_open or fetched_at >= market_open)):
+                logger.info("Scrip master downloaded recently, using cached copy")
+                return self._scrip_master_parquet(con)
+            
+            if meta[0]:
+                headers['If-None-Match'] = meta[0]
+            if meta[1]:
+                headers['If-Modified-Since'] = meta[1]
+            
+            # A HEAD is enough to tell the cache is fresh, even if the server ignores conditional GETs
+            try:
+                head = requests.head(ANGEL_API_URL, timeout=5)
+                head.raise_for_status()
+                etag, last_modified = head.headers.get('ETag'), head.headers.get('Last-Modified')
+                if (etag and etag == meta[0]) or (last_modified and last_modified == meta[1]):
+                    logger.info("Scrip master unchanged since last download, using cached copy")
+                    return self._scrip_master_parquet(con)
+            except requests.RequestException as e:
+                logger.warning(f"HEAD check of scrip master failed, falling back to GET: {e}")
+        
+        logger.info("Downloading token data from Angel Broking...")
+        with requests.get(ANGEL_API_URL, headers=headers, stream=True) as response:
+            response.raise_for_status()
+            if response.status_code == 304:
+                logger.info("Scrip master not modified, using cached copy")
+                return self._scrip_master_parquet(con)
+            
+            # Stream to a temp file and swap it in so a failed download keeps the old cache
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_file = f"{self.scrip_file}.tmp"
+            with open(tmp_file, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=1 << 20):
+                    f.write(chunk)
+            os.replace(tmp_file, self.scrip_file)
+            
+            con.execute("""
+                INSERT OR REPLACE INTO scrip_meta (url, etag, last_modified, fetched_at)
+                VALUES (?, ?, ?, ?)
+            """, [
+                ANGEL_API_URL,
+                response.headers.get('ETag'),
+                response.headers.get('Last-Modified'),
+                datetime.now(IST).replace(tzinfo=None)
+            ])
+        return self._scrip_master_parquet(con)
+
+    def _scrip_master_parquet(self, con) -> str:
+        """Convert the cached scrip master JSON to Parquet once per download.
+        
+        Warm runs then scan the columnar copy instead of re-parsing the JSON.
+        
+        Args:
+            con: Open DuckDB connection
+            
+        Returns:
+            str: Path of the scrip master Parquet file
+        """
+        if (os.path.exists(self.scrip_parquet)
+                and os.path.getmtime(self.scrip_parquet) >= os.path.getmtime(self.scrip_file)):
+            return self.scrip_parquet
+        
+        tmp_path = f"{self.scrip_parquet}.tmp"
+        scrip_file = self.scrip_file.replace("'", "''")
+        con.execute(f"""
+            COPY (
+                SELECT * FROM read_json('{scrip_file}', format = 'array', columns = {SCRIP_MASTER_COLUMNS})
+            ) TO '{tmp_path.replace("'", "''")}' (FORMAT PARQUET, COMPRESSION ZSTD)
+        """)
+        os.replace(tmp_path, self.scrip_parquet)
+        logger.info(f"Converted scrip master to {self.scrip_parquet}")
+        return self.scrip_parquet
+
+    def _export_tokens_snapshot(self, con, snapshot_date) -> str:
+        """Archive the day's token set as a hive-partitioned Parquet file.
+        
+        Snapshots land in tokens/date=YYYY-MM-DD/ under the export directory so
+        past token sets can be queried with read_parquet(..., hive_partitioning=1).
+        
+        Args:
+            con: Open DuckDB connection
+            snapshot_date (date): Trading date of the token set
+            
+        Returns:
+            str: Path of the exported Parquet file
+        """
+        partition_dir = os.path.join(self.export_dir, 'tokens', f"date={snapshot_date.isoformat()}")
+        os.makedirs(partition_dir, exist_ok=True)
+        path = os.path.join(partition_dir, 'tokens.parquet')
+        tmp_path = f"{path}.tmp"
+        con.execute(f"""
+            COPY tokens TO '{tmp_path.replace("'", "''")}'
+            (FORMAT PARQUET, COMPRESSION ZSTD)
+        """)
+        os.replace(tmp_path, path)
+        logger.info(f"Exported tokens snapshot to {path}")
+        return path
+
+    def download_and_store_tokens(self, force_refresh: bool = False) -> bool:
         """
         Download and store relevant tokens:
         1. Future tokens for nearest expiry
         2. Corresponding spot stock tokens
         3. Option tokens for the same stocks
+        Args:
+            force_refresh (bool): Re-download the scrip master even if the
+                stored tokens or the cached copy are current
         Returns:
             bool: True if successful, False otherwise
         """
+        con = None
         try:
-            if self.is_market_data_current():
+            if not force_refresh and self.is_market_data_current():
                 logger.info("Market data is already current. Skipping download.")
                 return True
             
-            logger.info("Downloading token data from Angel Broking...")
-            response = requests.get(ANGEL_API_URL)
-            response.raise_for_status()
-            tokens_data = response.json()
-            logger.info(f"Downloaded {len(tokens_data)} tokens from API")
-            
-            # Convert to DataFrame
-            df = pd.DataFrame(tokens_data)
+            con = self.con.cursor()
+            scrip_parquet = self._download_scrip_master(con, force_refresh)
             current_time = datetime.now(IST).replace(tzinfo=None)
             
-            # Add download timestamp
-            df['download_timestamp'] = current_time
-            
-            # Convert expiry to datetime for comparison
-            df['expiry_date'] = pd.to_datetime(df['expiry'], format='%d%b%Y', errors='coerce')
+            # Scan the columnar scrip master straight from disk inside the selection, so the
+            # exchange filter and column projection are pushed down to the Parquet reader
+            scrip_path = scrip_parquet.replace("'", "''")
+            scrip_source = f"read_parquet('{scrip_path}')"
+            total_tokens = con.execute(f"SELECT COUNT(*) FROM {scrip_source}").fetchone()[0]
+            logger.info(f"Downloaded {total_tokens} tokens from API")
             
-            # Step 1: Get Future tokens for nearest expiry
-            logger.info("Processing futures tokens...")
-            futures_mask = (
-                (df['exch_seg'] == 'NFO') & 
-                (df['instrumenttype'] == 'FUTSTK') &
-                (df['expiry_date'] >= pd.Timestamp.now())
-            )
-            futures_df = df[futures_mask].copy()  # Create a copy to avoid warnings
+            # Select futures for the nearest expiry, their spot stocks and the
+            # matching options in a single pass over the scrip master
+            logger.info("Processing futures, spot and options tokens...")
+            con.execute(f"""
+                CREATE TEMP TABLE selected_tokens AS
+                WITH raw AS (
+                    SELECT 
+                        *,
+                        -- Only derivatives need a parsed expiry, skip it for NSE rows
+                        CASE WHEN exch_seg = 'NFO' THEN try_strptime(expiry, '%d%b%Y') END AS expiry_date,
+                        -- Parse strike once and reuse it for the symbol and the stored value
+                        TRY_CAST(strike AS DOUBLE) AS strike_value
+                    FROM {scrip_source}
+                    WHERE exch_seg IN ('NFO', 'NSE')
+                ),
+                nearest AS (
+                    SELECT MIN(expiry_date) AS nearest_expiry
+                    FROM raw
+                    WHERE exch_seg = 'NFO'
+                        AND instrumenttype = 'FUTSTK'
+                        AND expiry_date >= ?
+                ),
+                future_names AS (
+                    SELECT DISTINCT name
+                    FROM raw, nearest
+                    WHERE exch_seg = 'NFO'
+                        AND instrumenttype = 'FUTSTK'
+                        AND expiry_date = nearest_expiry
+                ),
+                -- Label every candidate row in one pass instead of unioning three subsets
+                selected AS (
+                    SELECT *
+                    FROM (
+                        SELECT 
+                            raw.*,
+                            CASE 
+                                WHEN exch_seg = 'NFO' AND instrumenttype = 'FUTSTK'
+                                    AND expiry_date = nearest_expiry THEN 'FUTURES'
+                                WHEN exch_seg = 'NSE' AND symbol LIKE '%-EQ' THEN 'SPOT'
+                                WHEN exch_seg = 'NFO' AND instrumenttype = 'OPTSTK'
+                                    AND expiry_date = nearest_expiry THEN 'OPTIONS'
+                            END AS token_type
+                        FROM raw, nearest
+                        WHERE name IN (SELECT name FROM future_names)
+                    )
+                    WHERE token_type IS NOT NULL
+                )
+                SELECT 
+                    token,
+                    symbol,
+                    -- Format option symbols as NAME + EXPIRY + STRIKE + CE/PE
+                    CASE 
+                        WHEN instrumenttype IN ('OPTSTK', 'OPTIDX')
+                            AND strike_value > 0
+                        THEN name || expiry
+                            || CAST(trunc(strike_value / 100) AS BIGINT)
+                            || right(symbol, 2)
+                        ELSE symbol
+                    END AS formatted_symbol,
+                    name,
+                    expiry,
+                    strike_value AS strike,
+                    lotsize,
+                    instrumenttype,
+                    exch_seg,
+                    TRY_CAST(tick_size AS DOUBLE) AS tick_size,
+                    token_type,
+                    ?::TIMESTAMP AS download_timestamp,
+                    CAST(expiry_date AS DATE) AS expiry_date
+                FROM selected
+            """, [current_time, current_time])
             
-            if futures_df.empty:
+            futures_count, min_expiry = con.execute("""
+                SELECT COUNT(*), MIN(expiry_date)
+                FROM selected_tokens
+                WHERE token_type = 'FUTURES'
+            """).fetchone()
+            if futures_count == 0:
                 logger.error("No future tokens found")
                 return False
-                
-            # Get nearest expiry
-            min_expiry = futures_df['expiry_date'].min()
-            futures_df = futures_df[futures_df['expiry_date'] == min_expiry]
-            futures_df['token_type'] = 'FUTURES'
-            logger.info(f"Found {len(futures_df)} futures for expiry {min_expiry.strftime('%d%b%Y')}")
-            
-            # Step 2: Get corresponding spot tokens
-            logger.info("Processing spot tokens...")
-            stock_names = futures_df['name'].unique()
-            spot_mask = (
-                (df['exch_seg'] == 'NSE') & 
-                (df['name'].isin(stock_names)) & 
-                (df['symbol'].str.endswith('-EQ', na=False))
-            )
-            spot_df = df[spot_mask].copy()  # Create a copy to avoid warnings
-            spot_df['token_type'] = 'SPOT'
-            logger.info(f"Found {len(spot_df)} spot tokens")
             
-            # Step 3: Get options tokens for nearest expiry
-            logger.info("Processing options tokens...")
-            options_mask = (
-                (df['exch_seg'] == 'NFO') & 
-                (df['instrumenttype'] == 'OPTSTK') &
-                (df['name'].isin(stock_names)) & 
-                (df['expiry_date'] == min_expiry)
-            )
-            options_df = df[options_mask].copy()  # Create a copy to avoid warnings
-            options_df['token_type'] = 'OPTIONS'
-            logger.info(f"Found {len(options_df)} options tokens")
+            logger.info(f"Found {futures_count} futures for expiry {min_expiry.strftime('%d%b%Y')}")
             
-            # Combine all tokens
-            final_df = pd.concat([futures_df, spot_df, options_df], ignore_index=True)
-            
-            # Format symbols for options
-            mask = final_df['instrumenttype'].isin(['OPTSTK', 'OPTIDX'])
-            final_df.loc[mask, 'formatted_symbol'] = (
-                final_df.loc[mask].apply(
-                    lambda x: f"{x['name']}{x['expiry']}{int(float(x['strike'])/100)}{x['symbol'][-2:]}" 
-                    if pd.notna(x['strike']) and float(x['strike']) > 0 
-                    else x['symbol'],
-                    axis=1
-                )
-            )
-            
-            # Fill NaN values in formatted_symbol with original symbol
-            final_df['formatted_symbol'] = final_df['formatted_symbol'].fillna(final_df['symbol'])
-            
-            # Drop the temporary expiry_date column and ensure proper data types
-            final_df = final_df.drop(columns=['expiry_date'])
-            final_df['strike'] = pd.to_numeric(final_df['strike'], errors='coerce')
-            final_df['tick_size'] = pd.to_numeric(final_df['tick_size'], errors='coerce')
-            
-            # Convert columns to match database schema
+            # Columns in database schema order
             columns = [
                 'token', 'symbol', 'formatted_symbol', 'name', 'expiry', 
                 'strike', 'lotsize', 'instrumenttype', 'exch_seg', 'tick_size',
-                'token_type', 'download_timestamp'
+                'token_type', 'download_timestamp', 'expiry_date'
             ]
-            final_df = final_df[columns]  # Ensure correct column order
             
             # Store in database
-            con = duckdb.connect(self.db_file)
             con.execute("TRUNCATE TABLE tokens")
             
-            # Convert DataFrame to DuckDB table
-            con.execute("""
-                CREATE TEMP TABLE temp_tokens (
-                    token VARCHAR,
-                    symbol VARCHAR,
-                    formatted_symbol VARCHAR,
-                    name VARCHAR,
-                    expiry VARCHAR,
-                    strike DOUBLE,
-                    lotsize VARCHAR,
-                    instrumenttype VARCHAR,
-                    exch_seg VARCHAR,
-                    tick_size DOUBLE,
-                    token_type VARCHAR,
-                    download_timestamp TIMESTAMP
-                )
+            # Load the selection straight into tokens without leaving DuckDB,
+            # clustered by token_type so zone maps prune token_type filters
+            con.execute(f"""
+                INSERT INTO tokens ({', '.join(columns)})
+                SELECT {', '.join(columns)} FROM selected_tokens
+                ORDER BY token_type, name
             """)
-            con.execute("INSERT INTO temp_tokens SELECT * FROM final_df")
-            con.execute("INSERT INTO tokens SELECT * FROM temp_tokens")
-            con.execute("DROP TABLE temp_tokens")
+            con.execute("DROP TABLE selected_tokens")
             
             # Log summary by token type
-            summary = final_df.groupby('token_type').size()
+            summary = con.execute("""
+                SELECT token_type, COUNT(*) FROM tokens
+                GROUP BY token_type
+                ORDER BY token_type
+            """).fetchall()
             logger.info("\nToken processing summary:")
-            for type_, count in summary.items():
+            for type_, count in summary:
                 logger.info(f"- {type_}: {count} tokens")
             
+            self._export_tokens_snapshot(con, current_time.date())
             return True
             
         except requests.RequestException as e:
@@ -246,15 +447,29 @@ class TokenManager:
         except Exception as e:
             logger.error(f"Error storing tokens: {e}")
             return False
+        finally:
+            if con:
+                con.close()
 
     def connect(self):
-        """Create and return a database connection"""
+        """Return a cursor on the shared database connection"""
         try:
-            return duckdb.connect(self.db_file)
+            return self.con.cursor()
         except Exception as e:
             logger.error(f"Error connecting to database: {e}")
             raise
 
+    def close(self) -> None:
+        """Close the database connection if this manager opened it"""
+        if self._owns_connection:
+            self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
 if __name__ == "__main__":
     try:
         token_manager = TokenManager()
@@ -263,5 +478,6 @@ if __name__ == "__main__":
             logger.info("Token download and storage completed successfully")
         else:
             logger.error("Token download and storage failed")
+        token_manager.close()
     except Exception as e:
         logger.error(f"Error in main execution: {e}") 
\ No newline at end of file
@@ -2,20 +2,17 @@
 import os
 import sys
 from datetime import datetime
-import pytz
+from zoneinfo import ZoneInfo
 from logzero import logger, logfile
-from SmartApi import SmartConnect
-import pyotp
 
 # Add src directory to Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from data.token_manager import TokenManager
-from data.historical_data_manager import HistoricalDataManager
-from data.technical_indicators import TechnicalIndicatorManager
+# SmartApi, pyotp and the data managers (pandas, numpy, scipy, duckdb) are
+# imported inside the functions that use them to keep cron startup fast
 
 # Constants
-IST = pytz.timezone('Asia/Kolkata')
+IST = ZoneInfo('Asia/Kolkata')
 
 def setup_logging():
     """Setup logging configuration"""
@@ -28,6 +25,10 @@ def setup_logging():
 
 def connect_to_api():
     """Connect to Angel One API"""
+    from SmartApi import SmartConnect
+    import pyotp
+    from api.angel_one_connector import HTTP_POOL
+    
     try:
         # Get API credentials from environment
         api_key = os.getenv('ANGEL_ONE_APP_KEY')
@@ -42,7 +43,7 @@ def connect_to_api():
         totp = pyotp.TOTP(totp_secret)
         
         # Initialize API connection
-        smart_api = SmartConnect(api_key=api_key)
+        smart_api = SmartConnect(api_key=api_key, pool=HTTP_POOL)
         
         # Generate session
         data = smart_api.generateSession(client_id, pin, totp.now())
@@ -59,15 +60,21 @@ def connect_to_api():
 
 def refresh_market_data():
     """Refresh market data for the day"""
+    db = None
     try:
         # Setup logging
         setup_logging()
         logger.info("Starting market data refresh")
         
-        # Initialize managers
-        token_manager = TokenManager()
-        historical_manager = HistoricalDataManager(token_manager)
-        indicator_manager = TechnicalIndicatorManager()
+        from data.token_manager import TokenManager, connect_db
+        from data.historical_data_manager import HistoricalDataManager
+        from data.technical_indicators import TechnicalIndicatorManager
+        
+        # Initialize managers on one shared database connection
+        db = connect_db(os.getenv('DB_FILE', 'nfo_data.duckdb'))
+        token_manager = TokenManager(connection=db)
+        historical_manager = HistoricalDataManager(token_manager, connection=db)
+        indicator_manager = TechnicalIndicatorManager(connection=db)
         
         # Connect to API
         smart_api = connect_to_api()
@@ -104,6 +111,8 @@ def refresh_market_data():
             logger.info("API session terminated")
         except:
             pass
+        if db:
+            db.close()
 
 if __name__ == "__main__":
     from dotenv import load_dotenv
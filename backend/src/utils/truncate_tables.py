@@ -5,12 +5,17 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-def truncate_tables():
-    """Utility function to truncate all tables in the database"""
+def truncate_tables(connection=None):
+    """Utility function to truncate all tables in the database
+    
+    Args:
+        connection: Optional open DuckDB connection to reuse instead of opening the database file
+    """
     db_file = os.getenv('DB_FILE', 'nfo_data.duckdb')
+    con = None
     
     try:
-        con = duckdb.connect(db_file)
+        con = connection.cursor() if connection else duckdb.connect(db_file)
         logger.info("Connected to database")
         
         # List of tables to truncate
@@ -24,12 +29,30 @@ def truncate_tables():
             'realtime_options_data'
         ]
         
+        # Skip missing tables up front, a failed statement would abort the transaction
+        existing = {row[0] for row in con.execute("SELECT table_name FROM information_schema.tables").fetchall()}
         for table in tables:
-            try:
+            if table not in existing:
+                logger.warning(f"Skipping table {table}: table does not exist")
+        tables = [table for table in tables if table in existing]
+        
+        # Truncate everything in one transaction
+        if not tables:
+            return
+        try:
+            con.begin()
+            for table in tables:
                 con.execute(f"TRUNCATE TABLE {table}")
+            con.commit()
+            for table in tables:
                 logger.info(f"✅ Successfully truncated table: {table}")
-            except Exception as e:
-                logger.error(f"Failed to truncate table {table}: {e}")
+        except Exception as e:
+            # The failure may have ended the transaction already; keep the original error visible
+            try:
+                con.rollback()
+            except duckdb.Error:
+                pass
+            logger.error(f"Failed to truncate tables: {e}")
                 
     except Exception as e:
         logger.error(f"Database connection error: {e}")
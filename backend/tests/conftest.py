@@ -0,0 +1,77 @@
+import os
+import sys
+import pytest
+import duckdb
+import pyarrow as pa
+from datetime import date, datetime
+from functools import lru_cache
+
+# Add src directory to Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.api.market_data_api import app, get_db
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--force-refresh", action="store_true", default=False,
+        help="Re-download the scrip master even if today's tokens are already stored"
+    )
+
+@pytest.fixture(scope="session")
+def force_refresh(request) -> bool:
+    """Whether tests that load tokens should bypass the freshness checks"""
+    return request.config.getoption("--force-refresh")
+
+@lru_cache(maxsize=1)
+def _schema_sql() -> str:
+    """Build the indicator schema once and return its CREATE statements"""
+    from src.data.technical_indicators import TechnicalIndicatorManager
+    
+    con = duckdb.connect(':memory:')
+    try:
+        TechnicalIndicatorManager(connection=con)
+        return ";\n".join(row[0] for row in con.execute("SELECT sql FROM duckdb_tables()").fetchall())
+    finally:
+        con.close()
+
+@pytest.fixture(scope="session")
+def test_db():
+    """In-memory database with the API tables and one row of test market data"""
+    con = duckdb.connect(':memory:')
+    
+    # Create tables and insert test market data in one transaction
+    con.begin()
+    con.execute(_schema_sql())
+    
+    market_data = pa.Table.from_pydict({
+        'token': ['1234'], 'symbol': ['TEST'], 'name': ['Test Stock'],
+        'lotsize': ['100'], 'token_type': ['SPOT'], 'date': [date(2024, 3, 10)],
+        'open': [100.0], 'high': [105.0], 'low': [95.0], 'close': [102.0], 'volume': [1000000],
+        'ma_200': [98.0], 'ma_50': [99.0], 'ma_20': [101.0], 'ma_200_distance': [4.0],
+        'high_21d': [110.0], 'low_21d': [90.0], 'high_52w': [120.0], 'low_52w': [80.0],
+        'ath': [150.0], 'atl': [50.0], 'volume_15d_avg': [900000.0], 'volume_ratio': [1.1],
+        'rsi_14': [65.0], 'macd': [0.5], 'macd_signal': [0.3], 'macd_hist': [0.2],
+        'bb_upper': [105.0], 'bb_middle': [100.0], 'bb_lower': [95.0],
+        'breakout_detected': ['BREAKOUT'],
+        'last_updated': [datetime.now()]
+    })
+    con.register('test_market_data', market_data)
+    con.execute("INSERT INTO latest_market_data BY NAME SELECT * FROM test_market_data")
+    con.unregister('test_market_data')
+    con.commit()
+    
+    # Serve API requests from cursors on the test database
+    def override_get_db():
+        cursor = con.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+    
+    app.dependency_overrides[get_db] = override_get_db
+    
+    yield con
+    
+    # Cleanup
+    app.dependency_overrides.pop(get_db, None)
+    con.close()
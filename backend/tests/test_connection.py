@@ -31,10 +31,7 @@ def test_connection():
             logger.error("❌ Connection failed")
             
     except Exception as e:
-        logger.error(f"❌ Test failed with error: {str(e)}")
-        # Print full error traceback for debugging
-        import traceback
-        logger.error(traceback.format_exc())
+        logger.exception(f"❌ Test failed with error: {str(e)}")
 
 if __name__ == "__main__":
     test_connection() 
\ No newline at end of file
@@ -1,8 +1,6 @@
 import os
 import sys
 from logzero import logger
-from SmartApi import SmartConnect
-import pyotp
 from dotenv import load_dotenv
 
 # Add the project root to Python path
@@ -17,8 +15,13 @@ def test_historical_data():
         # Load environment variables
         load_dotenv()
         
+        # SmartApi and pyotp are only needed once the test actually runs
+        from SmartApi import SmartConnect
+        import pyotp
+        from src.api.angel_one_connector import HTTP_POOL
+        
         # Create Angel One connector instance
-        connector = SmartConnect(os.getenv('ANGEL_ONE_APP_KEY'))
+        connector = SmartConnect(os.getenv('ANGEL_ONE_APP_KEY'), pool=HTTP_POOL)
         totp = pyotp.TOTP(os.getenv('ANGEL_ONE_TOTP_SECRET'))
         
         # Generate session
@@ -47,10 +50,7 @@ def test_historical_data():
             logger.error("❌ Failed to fetch and store historical data")
             
     except Exception as e:
-        logger.error(f"❌ Test failed with error: {str(e)}")
-        # Print full error traceback for debugging
-        import traceback
-        logger.error(traceback.format_exc())
+        logger.exception(f"❌ Test failed with error: {str(e)}")
 
 if __name__ == "__main__":
     test_historical_data() 
\ No newline at end of file
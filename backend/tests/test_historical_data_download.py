@@ -1,11 +1,7 @@
 import os
 import sys
-import traceback
 from logzero import logger, setup_logger
-from SmartApi import SmartConnect
-import pyotp
 from dotenv import load_dotenv
-import duckdb
 import logzero
 
 # Add the project root to Python path
@@ -19,42 +15,32 @@ from src.utils.truncate_tables import truncate_tables
 # Set the logger level to INFO
 setup_logger(name=__name__, level=logzero.INFO)
 
-def limit_tokens_by_type(token_manager: TokenManager, token_type: str, limit: int = 5):
-    """Get limited number of tokens by type."""
-    con = None
-    try:
-        con = duckdb.connect(token_manager.db_file)
-        result = con.execute(f"""
-            SELECT 
-                token,
-                symbol,
-                name,
-                expiry,
-                token_type
-            FROM tokens
-            WHERE token_type = ?
-            LIMIT ?
-        """, [token_type, limit]).fetchall()
-        
-        return [
-            {
-                "token": row[0],
-                "symbol": row[1],
-                "name": row[2],
-                "expiry": row[3],
-                "token_type": row[4]
-            }
-            for row in result
-        ]
-    finally:
-        if con:
-            con.close()
+# Values are bound as parameters, never pasted into the SQL text
+LIMIT_TOKENS_BY_TYPE_QUERY = """
+    SELECT 
+        token,
+        symbol,
+        name,
+        expiry,
+        token_type
+    FROM tokens
+    WHERE token_type = ?
+    LIMIT ?
+"""
+
+def limit_tokens_by_type(con, token_type: str, limit: int = 5):
+    """Get limited number of tokens by type on an open connection."""
+    return con.execute(LIMIT_TOKENS_BY_TYPE_QUERY, [token_type, limit]).fetchdf().to_dict('records')
 
 class TestHistoricalDataManager(HistoricalDataManager):
     """A test version of HistoricalDataManager that limits tokens to 5"""
+    def __init__(self, token_manager: TokenManager):
+        super().__init__(token_manager)
+        self._limit_con = token_manager.connect()
+
     def get_tokens_by_type(self, token_type: str) -> list:
         """Override to return only 5 tokens"""
-        return limit_tokens_by_type(self.token_manager, token_type)
+        return limit_tokens_by_type(self._limit_con, token_type)
 
 def test_spot_data_download():
     try:
@@ -65,8 +51,13 @@ def test_spot_data_download():
         logger.info("Truncating existing tables...")
         truncate_tables()
         
+        # SmartApi and pyotp are only needed once the test actually runs
+        from SmartApi import SmartConnect
+        import pyotp
+        from src.api.angel_one_connector import HTTP_POOL
+        
         # Create Angel One connector instance
-        connector = SmartConnect(os.getenv('ANGEL_ONE_APP_KEY'))
+        connector = SmartConnect(os.getenv('ANGEL_ONE_APP_KEY'), pool=HTTP_POOL)
         totp = pyotp.TOTP(os.getenv('ANGEL_ONE_TOTP_SECRET'))
         
         # Generate session
@@ -111,26 +102,9 @@ def test_spot_data_download():
         # Verify the data in database
         con = None
         try:
-            con = duckdb.connect(historical_manager.db_file)
-            
-            # Check spot data
-            spot_stats = con.execute("""
-                SELECT 
-                    COUNT(DISTINCT token) as unique_tokens,
-                    COUNT(*) as total_records,
-                    MIN(timestamp) as earliest_date,
-                    MAX(timestamp) as latest_date
-                FROM historical_data
-                WHERE token_type = 'SPOT'
-            """).fetchone()
-            
-            logger.info("\nSpot Data Statistics:")
-            logger.info(f"- Unique tokens: {spot_stats[0]} (should be exactly 5)")
-            logger.info(f"- Total records: {spot_stats[1]}")
-            logger.info(f"- Date range: {spot_stats[2]} to {spot_stats[3]}")
+            con = token_manager.connect()
             
-            # Print detailed data for each token
-            logger.info("\nDetailed Data Verification:")
+            # Per-token breakdown; the overall statistics are folded from it instead of a second scan
             tokens_data = con.execute("""
                 SELECT 
                     token,
@@ -147,6 +121,26 @@ def test_spot_data_download():
                 ORDER BY symbol
             """).fetchall()
             
+            logger.info("\nSpot Data Statistics:")
+            logger.info(f"- Unique tokens: {len(tokens_data)} (should be exactly 5)")
+            logger.info(f"- Total records: {sum(row[2] for row in tokens_data)}")
+            if tokens_data:
+                logger.info(f"- Date range: {min(row[3] for row in tokens_data)} to {max(row[4] for row in tokens_data)}")
+            
+            # Print detailed data for each token
+            logger.info("\nDetailed Data Verification:")
+            
+            # Fetch the 3 most recent data points of every token in one query
+            recent_points = {}
+            for point in con.execute("""
+                SELECT token, timestamp, open, high, low, close, volume
+                FROM historical_data
+                WHERE token_type = 'SPOT'
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY token ORDER BY timestamp DESC) <= 3
+                ORDER BY token, timestamp DESC
+            """).fetchall():
+                recent_points.setdefault(point[0], []).append(point[1:])
+            
             for row in tokens_data:
                 logger.info(f"\nToken: {row[1]} ({row[0]})")
                 logger.info(f"- Records: {row[2]:,}")
@@ -154,29 +148,18 @@ def test_spot_data_download():
                 logger.info(f"- Price Range: {row[5]:,.2f} to {row[6]:,.2f}")
                 logger.info(f"- Total Volume: {row[7]:,}")
                 
-                # Sample some actual data points
-                sample_data = con.execute("""
-                    SELECT timestamp, open, high, low, close, volume
-                    FROM historical_data
-                    WHERE token = ?
-                    ORDER BY timestamp DESC
-                    LIMIT 3
-                """, [row[0]]).fetchall()
-                
                 logger.info("- Recent Data Points:")
-                for point in sample_data:
+                for point in recent_points.get(row[0], []):
                     logger.info(f"  {point[0]}: O={point[1]:.2f} H={point[2]:.2f} L={point[3]:.2f} C={point[4]:.2f} V={point[5]:,}")
             
         except Exception as e:
-            logger.error(f"Error verifying data: {e}")
-            logger.error(traceback.format_exc())
+            logger.exception(f"Error verifying data: {e}")
         finally:
             if con:
                 con.close()
             
     except Exception as e:
-        logger.error(f"❌ Test failed with error: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception(f"❌ Test failed with error: {str(e)}")
 
 if __name__ == "__main__":
     test_spot_data_download() 
\ No newline at end of file
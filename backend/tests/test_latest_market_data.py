@@ -1,11 +1,8 @@
 import os
 import sys
-import traceback
 from logzero import logger, setup_logger
-import duckdb
 import logzero
 from datetime import datetime, timedelta
-import pytz
 
 # Add the project root to Python path
 project_root = os.path.dirname(os.path.abspath(__file__))
@@ -17,22 +14,24 @@ from src.data.token_manager import TokenManager
 # Set the logger level to INFO
 setup_logger(name=__name__, level=logzero.INFO)
 
-def test_latest_market_data():
+def test_latest_market_data(force_refresh: bool):
     try:
         # Initialize managers
         token_manager = TokenManager()
-        indicator_manager = TechnicalIndicatorManager()
+        indicator_manager = TechnicalIndicatorManager(token_manager.con)
         
-        # First download and store tokens
+        # First download and store tokens; skipped inside when today's tokens are already stored
         logger.info("Downloading and storing tokens...")
-        if not token_manager.download_and_store_tokens():
+        if not token_manager.download_and_store_tokens(force_refresh=force_refresh):
             logger.error("Failed to download and store tokens")
             return
             
-        # Verify token data
+        # One cursor on the managers' shared connection serves every verification below
         con = None
         try:
-            con = duckdb.connect(token_manager.db_file)
+            con = token_manager.connect()
+            
+            # Verify token data
             token_stats = con.execute("""
                 SELECT 
                     token_type,
@@ -45,38 +44,29 @@ def test_latest_market_data():
             logger.info("\nToken Statistics:")
             for token_type, count in token_stats:
                 logger.info(f"- {token_type}: {count} tokens")
-        finally:
-            if con:
-                con.close()
-        
-        # Calculate technical indicators for all tokens
-        logger.info("\nCalculating technical indicators for all tokens...")
-        if not indicator_manager.calculate_all_indicators():
-            logger.error("Failed to calculate technical indicators")
-            return
-        
-        # Update latest market data
-        logger.info("\nUpdating latest market data...")
-        if not indicator_manager.update_latest_market_data():
-            logger.error("Failed to update latest market data")
-            return
-        
-        # Verify the data
-        con = None
-        try:
-            con = duckdb.connect(indicator_manager.db_file)
+            
+            # Calculate technical indicators for all tokens
+            logger.info("\nCalculating technical indicators for all tokens...")
+            if not indicator_manager.calculate_all_indicators():
+                logger.error("Failed to calculate technical indicators")
+                return
+            
+            # Update latest market data
+            logger.info("\nUpdating latest market data...")
+            if not indicator_manager.update_latest_market_data():
+                logger.error("Failed to update latest market data")
+                return
             
             # Get summary statistics
             stats = con.execute("""
                 SELECT 
                     COUNT(*) as record_count,
                     COUNT(DISTINCT token_type) as token_types,
-                    MIN(date) as data_date,
                     MAX(date) as data_date,
-                    COUNT(CASE WHEN breakout_detected THEN 1 END) as breakouts,
-                    COUNT(CASE WHEN ma_200_distance > 0 THEN 1 END) as above_ma200,
-                    COUNT(CASE WHEN rsi_14 > 70 THEN 1 END) as overbought,
-                    COUNT(CASE WHEN rsi_14 < 30 THEN 1 END) as oversold
+                    COUNT(breakout_detected) as breakouts,
+                    COUNT(*) FILTER (WHERE ma_200_distance > 0) as above_ma200,
+                    COUNT(*) FILTER (WHERE rsi_14 > 70) as overbought,
+                    COUNT(*) FILTER (WHERE rsi_14 < 30) as oversold
                 FROM latest_market_data
             """).fetchone()
             
@@ -84,67 +74,55 @@ def test_latest_market_data():
             logger.info(f"- Total Records: {stats[0]}")
             logger.info(f"- Token Types: {stats[1]}")
             logger.info(f"- Data Date: {stats[2]}")
-            logger.info(f"- Breakout Signals: {stats[4]}")
-            logger.info(f"- Above 200 MA: {stats[5]}")
-            logger.info(f"- Overbought (RSI > 70): {stats[6]}")
-            logger.info(f"- Oversold (RSI < 30): {stats[7]}")
+            logger.info(f"- Breakout Signals: {stats[3]}")
+            logger.info(f"- Above 200 MA: {stats[4]}")
+            logger.info(f"- Overbought (RSI > 70): {stats[5]}")
+            logger.info(f"- Oversold (RSI < 30): {stats[6]}")
             
-            # Sample some records
-            sample_data = con.execute("""
+            # Top stocks by volume and potential trading signals from one ranked scan
+            ranked = con.execute("""
+                WITH flagged AS (
+                    SELECT 
+                        symbol,
+                        name,
+                        lotsize,
+                        close,
+                        volume,
+                        volume_ratio,
+                        ma_200_distance,
+                        rsi_14,
+                        macd,
+                        breakout_detected,
+                        COALESCE(
+                            breakout_detected IS NOT NULL
+                            OR (volume > volume_15d_avg * 2 AND close > high_21d)
+                            OR (rsi_14 < 30 AND ma_200_distance > -5),
+                            false
+                        ) as is_signal
+                    FROM latest_market_data
+                )
                 SELECT 
-                    symbol,
-                    name,
-                    lotsize,
-                    close,
-                    volume,
-                    ma_200_distance,
-                    rsi_14,
-                    macd,
-                    breakout_detected
-                FROM latest_market_data
+                    *,
+                    ROW_NUMBER() OVER (ORDER BY volume DESC) as volume_rank
+                FROM flagged
+                QUALIFY ROW_NUMBER() OVER (ORDER BY volume DESC) <= 5
+                    OR (is_signal AND ROW_NUMBER() OVER (PARTITION BY is_signal ORDER BY volume DESC) <= 5)
                 ORDER BY volume DESC
-                LIMIT 5
-            """).fetchall()
+            """).fetchdf()
+            sample_data = ranked[ranked['volume_rank'] <= 5]
+            signals = ranked[ranked['is_signal']].head(5)
             
-            logger.info("\nTop 5 Stocks by Volume:")
-            for row in sample_data:
-                logger.info(f"\nStock: {row[0]} ({row[1]})")
-                logger.info(f"- Lot Size: {row[2]}")
-                logger.info(f"- Close: {row[3]:.2f}")
-                logger.info(f"- Volume: {row[4]:,}")
-                logger.info(f"- MA200 Distance: {row[5]:.2f}%")
-                logger.info(f"- RSI: {row[6]:.2f}")
-                logger.info(f"- MACD: {row[7]:.2f}")
-                logger.info(f"- Breakout: {row[8]}")
-            
-            # Check for potential trading signals
-            signals = con.execute("""
-                SELECT 
-                    symbol,
-                    name,
-                    close,
-                    volume,
-                    volume_ratio,
-                    rsi_14,
-                    ma_200_distance
-                FROM latest_market_data
-                WHERE 
-                    breakout_detected 
-                    OR (volume > volume_15d_avg * 2 AND close > high_21d)
-                    OR (rsi_14 < 30 AND ma_200_distance > -5)
-                ORDER BY volume DESC
-                LIMIT 5
-            """).fetchall()
+            # Log each table as one formatted block rather than a line per field
+            logger.info("\nTop 5 Stocks by Volume:\n" + sample_data[[
+                'symbol', 'name', 'lotsize', 'close', 'volume',
+                'ma_200_distance', 'rsi_14', 'macd', 'breakout_detected'
+            ]].to_string(index=False, float_format='{:.2f}'.format))
             
-            if signals:
-                logger.info("\nPotential Trading Signals:")
-                for row in signals:
-                    logger.info(f"\nStock: {row[0]} ({row[1]})")
-                    logger.info(f"- Close: {row[2]:.2f}")
-                    logger.info(f"- Volume: {row[3]:,}")
-                    logger.info(f"- Volume Ratio: {row[4]:.2f}")
-                    logger.info(f"- RSI: {row[5]:.2f}")
-                    logger.info(f"- MA200 Distance: {row[6]:.2f}%")
+            if not signals.empty:
+                logger.info("\nPotential Trading Signals:\n" + signals[[
+                    'symbol', 'name', 'close', 'volume',
+                    'volume_ratio', 'rsi_14', 'ma_200_distance'
+                ]].to_string(index=False, float_format='{:.2f}'.format))
             else:
                 logger.info("\nNo trading signals detected")
             
@@ -153,8 +131,7 @@ def test_latest_market_data():
                 con.close()
                 
     except Exception as e:
-        logger.error(f"❌ Test failed with error: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception(f"❌ Test failed with error: {str(e)}")
 
 if __name__ == "__main__":
-    test_latest_market_data() 
\ No newline at end of file
+    test_latest_market_data(force_refresh='--force-refresh' in sys.argv) 
\ No newline at end of file
@@ -1,12 +1,14 @@
 import os
 import sys
-import json
 import duckdb
+import orjson
+import logging
 import asyncio
+from functools import lru_cache
 from logzero import logger
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
-from pytz import timezone
+from datetime import datetime
+from zoneinfo import ZoneInfo
 
 # Add backend directory to Python path
 backend_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -19,7 +21,10 @@ from src.data.angel_market_data import AngelMarketData
 
 load_dotenv()
 
-IST = timezone('Asia/Kolkata')
+IST = ZoneInfo('Asia/Kolkata')
+
+# getMarketData accepts at most 50 tokens per exchange segment
+MAX_TOKENS_PER_REQUEST = 50
 
 def log_request_response(request_data: dict, response_data: dict, data_type: str):
     """Log the request and response data.
@@ -29,20 +34,52 @@ def log_request_response(request_data: dict, response_data: dict, data_type: str
         response_data (dict): Response data
         data_type (str): Type of data (SPOT/FUTURES/OPTIONS)
     """
-    logger.info(f"\n{'='*20} {data_type} Request/Response {'='*20}")
-    logger.info(f"\nRequest Payload:")
-    logger.info(json.dumps(request_data, indent=2))
+    # Skip the pretty-printing entirely when INFO output is silenced
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    
+    logger.info("\n%s %s Request/Response %s", '=' * 20, data_type, '=' * 20)
+    logger.info("\nRequest Payload:")
+    logger.info("%s", orjson.dumps(request_data, option=orjson.OPT_INDENT_2, default=str).decode('utf-8'))
     
-    logger.info(f"\nRaw Response:")
-    logger.info(json.dumps(response_data, indent=2))
+    logger.info("\nRaw Response:")
+    logger.info("%s", orjson.dumps(response_data, option=orjson.OPT_INDENT_2, default=str).decode('utf-8'))
     
     if response_data and isinstance(response_data, dict):
-        logger.info(f"\nResponse Structure:")
+        logger.info("\nResponse Structure:")
         for key, value in response_data.items():
             if isinstance(value, (list, dict)):
-                logger.info(f"{key}: {type(value).__name__} with {len(value)} items")
+                logger.info("%s: %s with %d items", key, type(value).__name__, len(value))
             else:
-                logger.info(f"{key}: {type(value).__name__} = {value}")
+                logger.info("%s: %s = %s", key, type(value).__name__, value)
+
+def merge_exchange_tokens(tokens) -> dict:
+    """Group (token, symbol, exch_seg, ...) rows into a getMarketData exchangeTokens payload.
+    
+    Args:
+        tokens: Rows with the token first and the exchange segment third
+        
+    Returns:
+        dict: Exchange segment to list of tokens
+    """
+    exchange_tokens = {}
+    for token in tokens:
+        exchange_tokens.setdefault(token[2], []).append(token[0])
+    return exchange_tokens
+
+def partition_fetched(response_data: dict) -> dict:
+    """Split the fetched quotes of a combined getMarketData response by token.
+    
+    Args:
+        response_data (dict): getMarketData response
+        
+    Returns:
+        dict: symbolToken to list of fetched quotes
+    """
+    fetched_by_token = {}
+    for item in response_data.get('data', {}).get('fetched', []):
+        fetched_by_token.setdefault(item.get('symbolToken'), []).append(item)
+    return fetched_by_token
 
 def test_strike_intervals(market_data_manager: AngelMarketData, con: duckdb.DuckDBPyConnection):
     """Test strike interval calculation"""
@@ -81,13 +118,13 @@ def test_atm_strikes(market_data_manager: AngelMarketData, con: duckdb.DuckDBPyC
         SELECT t.name, t.expiry, f.ltp
         FROM tokens t
         JOIN (
-            SELECT symbol, ltp
+            SELECT name, ltp
             FROM realtime_futures_data
             WHERE timestamp = (
                 SELECT MAX(timestamp)
                 FROM realtime_futures_data
             )
-        ) f ON REPLACE(f.symbol, '27FEB25FUT', '') = t.name
+        ) f ON f.name = t.name
         WHERE t.token_type = 'OPTIONS'
         AND t.name = 'RELIANCE'
         LIMIT 1
@@ -159,76 +196,61 @@ async def test_market_data():
         # Get test data
         con = None
         try:
-            con = duckdb.connect(os.getenv('DB_FILE', 'nfo_data.duckdb'))
+            con = token_manager.connect()
             
             # Test strike interval calculation
             if not test_strike_intervals(market_data_manager, con):
                 return False
                 
-            # Test spot data first to get LTP for futures
-            spot_token = con.execute("""
-                SELECT token, symbol, exch_seg
-                FROM tokens 
-                WHERE token_type = 'SPOT'
-                AND name = 'RELIANCE'
-                LIMIT 1
-            """).fetchone()
+            # Test spot and futures data in one request
+            sample_tokens = {
+                row[0]: row[1:]
+                for row in con.execute("""
+                    SELECT token_type, FIRST(token), FIRST(symbol), FIRST(exch_seg)
+                    FROM tokens 
+                    WHERE token_type IN ('SPOT', 'FUTURES')
+                    AND name = 'RELIANCE'
+                    GROUP BY token_type
+                """).fetchall()
+            }
             
+            spot_token = sample_tokens.get('SPOT')
             if not spot_token:
                 logger.error("Failed to get RELIANCE spot token")
                 return False
                 
-            # Test spot data
-            logger.info("\nTesting SPOT market data...")
-            spot_request = {
-                "mode": "FULL",
-                "exchangeTokens": {
-                    spot_token[2]: [spot_token[0]]
-                }
-            }
-            spot_data = connector.api.getMarketData(**spot_request)
-            log_request_response(spot_request, spot_data, "SPOT")
-            
-            if spot_data and spot_data.get('status'):
-                fetched_data = spot_data.get('data', {}).get('fetched', [])
-                if fetched_data:
-                    logger.info("Storing SPOT market data...")
-                    if not market_data_manager._store_spot_data(fetched_data):
-                        logger.error("❌ Failed to store SPOT market data")
-                        return False
-                    logger.info("✅ Successfully stored SPOT market data")
-            
-            # Test futures data
-            futures_token = con.execute("""
-                SELECT token, symbol, exch_seg
-                FROM tokens 
-                WHERE token_type = 'FUTURES'
-                AND name = 'RELIANCE'
-                LIMIT 1
-            """).fetchone()
-            
+            futures_token = sample_tokens.get('FUTURES')
             if not futures_token:
                 logger.error("Failed to get RELIANCE futures token")
                 return False
                 
-            logger.info("\nTesting FUTURES market data...")
-            futures_request = {
+            logger.info("\nTesting SPOT and FUTURES market data...")
+            combined_request = {
                 "mode": "FULL",
-                "exchangeTokens": {
-                    futures_token[2]: [futures_token[0]]
-                }
+                "exchangeTokens": merge_exchange_tokens([spot_token, futures_token])
             }
-            futures_data = connector.api.getMarketData(**futures_request)
-            log_request_response(futures_request, futures_data, "FUTURES")
+            combined_data = connector.api.getMarketData(**combined_request)
             
-            if futures_data and futures_data.get('status'):
-                fetched_data = futures_data.get('data', {}).get('fetched', [])
-                if fetched_data:
-                    logger.info("Storing FUTURES market data...")
-                    if not market_data_manager._store_futures_data(fetched_data):
-                        logger.error("❌ Failed to store FUTURES market data")
-                        return False
-                    logger.info("✅ Successfully stored FUTURES market data")
+            if combined_data and combined_data.get('status'):
+                fetched_by_token = partition_fetched(combined_data)
+                for data_type, token, store in (
+                    ("SPOT", spot_token, market_data_manager._store_spot_data),
+                    ("FUTURES", futures_token, market_data_manager._store_futures_data)
+                ):
+                    fetched_data = fetched_by_token.get(token[0], [])
+                    log_request_response(
+                        {"mode": "FULL", "exchangeTokens": {token[2]: [token[0]]}},
+                        {**combined_data, "data": {**combined_data.get('data', {}), "fetched": fetched_data}},
+                        data_type
+                    )
+                    if fetched_data:
+                        logger.info(f"Storing {data_type} market data...")
+                        if not store(fetched_data):
+                            logger.error(f"❌ Failed to store {data_type} market data")
+                            return False
+                        logger.info(f"✅ Successfully stored {data_type} market data")
+            else:
+                log_request_response(combined_request, combined_data, "SPOT/FUTURES")
             
             # Test ATM strike selection
             if not test_atm_strikes(market_data_manager, con):
@@ -264,23 +286,22 @@ async def test_market_data():
             for option_token in options_tokens:
                 logger.info(f"Testing with ATM option: {option_token[1]} (Strike: {option_token[3]})")
                 
-                options_request = {
-                    "mode": "FULL",
-                    "exchangeTokens": {
-                        option_token[2]: [option_token[0]]
-                    }
-                }
-                options_data = connector.api.getMarketData(**options_request)
-                log_request_response(options_request, options_data, "OPTIONS")
-                
-                if options_data and options_data.get('status'):
-                    fetched_data = options_data.get('data', {}).get('fetched', [])
-                    if fetched_data:
-                        logger.info("Storing OPTIONS market data...")
-                        if not market_data_manager._store_options_data(fetched_data):
-                            logger.error("❌ Failed to store OPTIONS market data")
-                            return False
-                        logger.info("✅ Successfully stored OPTIONS market data")
+            # Fetch all ATM options in one request
+            options_request = {
+                "mode": "FULL",
+                "exchangeTokens": merge_exchange_tokens(options_tokens)
+            }
+            options_data = connector.api.getMarketData(**options_request)
+            log_request_response(options_request, options_data, "OPTIONS")
+            
+            if options_data and options_data.get('status'):
+                fetched_data = options_data.get('data', {}).get('fetched', [])
+                if fetched_data:
+                    logger.info("Storing OPTIONS market data...")
+                    if not market_data_manager._store_options_data(fetched_data):
+                        logger.error("❌ Failed to store OPTIONS market data")
+                        return False
+                    logger.info("✅ Successfully stored OPTIONS market data")
             
             logger.info("\nMarket data test completed successfully")
             return True
@@ -321,29 +342,70 @@ async def test_market_data_continuous():
                 logger.error("Failed to refresh token data")
                 return False
 
+        # Keep one cursor on the managers' shared connection for the whole run; a second
+        # duckdb.connect with a different config would be rejected for the same file
+        con = token_manager.connect()
+        con.execute(f"SET threads = {os.cpu_count() or 1}")
+        con.execute("SET enable_object_cache = true")
+        
         # Load initial tokens for all symbols
-        con = duckdb.connect(os.getenv('DB_FILE', 'nfo_data.duckdb'))
         symbols = ['RELIANCE', 'ITC', 'ZOMATO', 'MRF', 'IDEA']
         
-        # Get spot and futures tokens for all symbols
-        spot_tokens = con.execute("""
-            SELECT token, symbol, name, exch_seg
+        # Get spot and futures tokens for all symbols in one query
+        spot_tokens, futures_tokens = [], []
+        for token_type, *token in con.execute("""
+            SELECT token_type, token, symbol, name, exch_seg
             FROM tokens 
-            WHERE token_type = 'SPOT'
+            WHERE token_type IN ('SPOT', 'FUTURES')
             AND name IN (SELECT UNNEST(?))
-        """, [symbols]).fetchall()
+        """, [symbols]).fetchall():
+            (spot_tokens if token_type == 'SPOT' else futures_tokens).append(tuple(token))
         
-        futures_tokens = con.execute("""
-            SELECT token, symbol, name, exch_seg
-            FROM tokens 
-            WHERE token_type = 'FUTURES'
+        # The strike -> option token mapping is fixed for the session, so load it once
+        options_table = con.execute("""
+            SELECT name, strike/100 AS strike_price, token, symbol, exch_seg
+            FROM tokens
+            WHERE token_type = 'OPTIONS'
             AND name IN (SELECT UNNEST(?))
-        """, [symbols]).fetchall()
+            AND (symbol LIKE '%CE' OR symbol LIKE '%PE')
+            ORDER BY name, strike, symbol
+        """, [symbols]).fetch_arrow_table()
+        
+        # Convert column by column rather than building a Python tuple per row
+        options_by_name_strike = {}
+        for name, strike, token, symbol, exch_seg in zip(
+            *(options_table.column(column).to_pylist() for column in options_table.column_names)
+        ):
+            options_by_name_strike.setdefault((name, round(strike, 2)), []).append((token, symbol, exch_seg))
+
+        # Resolve the API and store methods used by the minute loop once
+        get_market = connector.api.getMarketData
+        store_spot = market_data_manager._store_spot_data
+        store_fut = market_data_manager._store_futures_data
+        store_opt = market_data_manager._store_options_data
+        strike_iv = market_data_manager._get_strike_interval
+        atm = market_data_manager._get_atm_strikes
 
+        # Blocking getMarketData calls run in worker threads, capped below the broker limit
+        semaphore = asyncio.Semaphore(8)
+        
+        async def fetch(request: dict):
+            async with semaphore:
+                return await asyncio.to_thread(get_market, **request)
+        
+        # Strike intervals only change with the option chain, so compute them once per session
+        @lru_cache(maxsize=256)
+        def _cached_interval(name: str, expiry: str) -> float:
+            return strike_iv(name, expiry)
+        
+        # Schedule iterations on the monotonic loop clock, anchored to the current minute
+        loop = asyncio.get_running_loop()
+        start_time = datetime.now(IST)
+        anchor = loop.time() - start_time.second - start_time.microsecond / 1e6
+        
         while True:  # 1-minute loop
             try:
-                current_time = datetime.now(IST)
-                logger.info(f"\nFetching data at {current_time.strftime('%Y-%m-%d %H:%M:%S')}")
+                logger.info("\nFetching data at %s", datetime.now(IST).strftime('%Y-%m-%d %H:%M:%S'))
                 
                 # Parallel fetch spot & futures prices
                 spot_request = {
@@ -359,89 +421,108 @@ async def test_market_data_continuous():
                     }
                 }
                 
-                # Make API calls
-                spot_data = connector.api.getMarketData(**spot_request)
-                futures_data = connector.api.getMarketData(**futures_request)
+                # Make API calls concurrently
+                spot_data, futures_data = await asyncio.gather(fetch(spot_request), fetch(futures_request))
                 
                 # Store spot and futures data
                 if spot_data and spot_data.get('status'):
-                    market_data_manager._store_spot_data(spot_data.get('data', {}).get('fetched', []))
+                    store_spot(spot_data.get('data', {}).get('fetched', []))
                 
                 if futures_data and futures_data.get('status'):
-                    market_data_manager._store_futures_data(futures_data.get('data', {}).get('fetched', []))
+                    store_fut(futures_data.get('data', {}).get('fetched', []))
                 
-                # Process futures prices and get ATM strikes for each symbol
+                # Get the latest futures price of every symbol in one pass
+                latest = con.execute("""
+                    SELECT f.name, f.ltp, t.expiry
+                    FROM (
+                        SELECT name, ltp, timestamp
+                        FROM realtime_futures_data
+                        WHERE name IN (SELECT UNNEST(?))
+                        QUALIFY ROW_NUMBER() OVER (PARTITION BY name ORDER BY timestamp DESC) = 1
+                    ) f
+                    JOIN tokens t ON t.name = f.name AND t.token_type = 'FUTURES'
+                """, [symbols]).fetchall()
+                latest_by_symbol = {row[0]: (row[1], row[2]) for row in latest}
+                
+                # Work out the ATM strikes of every symbol first
+                strikes_by_name = {}
                 for symbol in symbols:
                     try:
-                        # Get latest futures price
-                        future_result = con.execute("""
-                            SELECT f.ltp, t.name, t.expiry
-                            FROM realtime_futures_data f
-                            JOIN tokens t ON t.name = f.name
-                            WHERE f.name = ?
-                            AND f.timestamp = (
-                                SELECT MAX(timestamp)
-                                FROM realtime_futures_data
-                                WHERE name = ?
-                            )
-                        """, [symbol, symbol]).fetchone()
-                        
+                        future_result = latest_by_symbol.get(symbol)
                         if not future_result:
                             logger.warning(f"No futures data found for {symbol}")
                             continue
                             
-                        future_price, name, expiry = future_result
+                        future_price, expiry = future_result
                         
                         # Calculate strike interval and ATM strikes
-                        interval = market_data_manager._get_strike_interval(name, expiry)
+                        interval = _cached_interval(symbol, expiry)
                         if not interval:
-                            logger.error(f"Failed to get strike interval for {name}")
+                            logger.error(f"Failed to get strike interval for {symbol}")
                             continue
                             
-                        strikes = market_data_manager._get_atm_strikes(name, future_price, interval)
+                        strikes = atm(symbol, future_price, interval)
                         if not strikes:
-                            logger.error(f"Failed to calculate ATM strikes for {name}")
+                            logger.error(f"Failed to calculate ATM strikes for {symbol}")
                             continue
                             
-                        # Get ATM options tokens
-                        options_tokens = con.execute("""
-                            SELECT t.token, t.symbol, t.exch_seg
-                            FROM tokens t
-                            WHERE t.token_type = 'OPTIONS'
-                            AND t.name = ?
-                            AND t.strike/100 IN (SELECT UNNEST(?))
-                            AND (t.symbol LIKE '%CE' OR t.symbol LIKE '%PE')
-                            ORDER BY t.strike, t.symbol
-                        """, [name, strikes]).fetchall()
-                        
-                        if not options_tokens:
-                            logger.warning(f"No ATM options found for {name}")
-                            continue
-                            
-                        # Fetch and store options data
-                        options_request = {
-                            "mode": "FULL",
-                            "exchangeTokens": {
-                                "NFO": [token[0] for token in options_tokens]
-                            }
-                        }
-                        
-                        options_data = connector.api.getMarketData(**options_request)
-                        if options_data and options_data.get('status'):
-                            market_data_manager._store_options_data(options_data.get('data', {}).get('fetched', []))
+                        strikes_by_name[symbol] = strikes
                             
                     except Exception as e:
                         logger.error(f"Error processing {symbol}: {str(e)}")
                         continue
                 
+                # Resolve all (name, strike) pairs against the preloaded option tokens in one pass
+                pairs = [(name, round(strike, 2)) for name, strikes in strikes_by_name.items() for strike in sorted(strikes)]
+                options_by_name = {}
+                for pair in pairs:
+                    options_by_name.setdefault(pair[0], []).extend(options_by_name_strike.get(pair, []))
+                
+                for name, options_tokens in options_by_name.items():
+                    if not options_tokens:
+                        logger.warning(f"No ATM options found for {name}")
+                
+                # Fetch all ATM options in one NFO request, split at the per-request token limit
+                all_option_tokens = [token[0] for tokens in options_by_name.values() for token in tokens]
+                options_results = await asyncio.gather(
+                    *[
+                        fetch({"mode": "FULL", "exchangeTokens": {"NFO": all_option_tokens[i:i + MAX_TOKENS_PER_REQUEST]}})
+                        for i in range(0, len(all_option_tokens), MAX_TOKENS_PER_REQUEST)
+                    ],
+                    return_exceptions=True
+                )
+                
+                fetched_by_token = {}
+                for options_data in options_results:
+                    if isinstance(options_data, Exception):
+                        logger.error(f"Error fetching options: {str(options_data)}")
+                        continue
+                    if options_data and options_data.get('status'):
+                        for token, items in partition_fetched(options_data).items():
+                            fetched_by_token.setdefault(token, []).extend(items)
+                
+                # Store the fetched quotes per symbol
+                for name, options_tokens in options_by_name.items():
+                    fetched_data = [item for token in options_tokens for item in fetched_by_token.get(token[0], [])]
+                    if fetched_data:
+                        store_opt(fetched_data)
+                
                 # Wait for next minute
-                next_minute = (current_time + timedelta(minutes=1)).replace(second=0, microsecond=0)
-                wait_seconds = (next_minute - datetime.now(IST)).total_seconds()
-                if wait_seconds > 0:
-                    await asyncio.sleep(wait_seconds)
+                anchor += 60
+                await asyncio.sleep(max(0, anchor - loop.time()))
                     
+            except duckdb.Error as e:
+                # Only a database failure warrants a fresh cursor
+                logger.error(f"Database error in main loop: {str(e)}")
+                con.close()
+                con = token_manager.connect()
+                anchor = loop.time() + 60
+                await asyncio.sleep(60)  # Wait a minute before retrying
+                continue
+                
             except Exception as e:
                 logger.error(f"Error in main loop: {str(e)}")
+                anchor = loop.time() + 60
                 await asyncio.sleep(60)  # Wait a minute before retrying
                 continue
                 
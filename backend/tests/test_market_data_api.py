@@ -1,65 +1,56 @@
 import os
 import sys
+import json
+import asyncio
+import httpx
 import pytest
+import pandas as pd
 from fastapi.testclient import TestClient
 from datetime import datetime
-import pytz
+from zoneinfo import ZoneInfo
 from typing import Dict, Any
-import duckdb
 
 # Add src directory to Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from src.api.market_data_api import app, set_test_db
-from src.data.technical_indicators import TechnicalIndicatorManager
+from src.api import market_data_api
+from src.api.market_data_api import app
 
 # Constants
-IST = pytz.timezone('Asia/Kolkata')
+IST = ZoneInfo('Asia/Kolkata')
 client = TestClient(app)
 
-@pytest.fixture(scope="session")
-def test_db():
-    """Create test database and required tables"""
-    # Use in-memory database for testing
-    os.environ['DB_FILE'] = ':memory:'
-    
-    # Create a single connection for the entire test session
-    con = duckdb.connect(':memory:')
-    
-    # Set the test connection for the API
-    set_test_db(con)
-    
-    # Initialize tables using the same connection
-    indicator_manager = TechnicalIndicatorManager(test_connection=con)
-    indicator_manager.setup_database()
-    
-    # Insert test market data using the same connection
-    con.execute("""
-        INSERT INTO latest_market_data VALUES (
-            '1234', 'TEST', 'Test Stock', '100', 'SPOT', '2024-03-10',
-            100.0, 105.0, 95.0, 102.0, 1000000,
-            98.0, 99.0, 101.0, 4.0,
-            110.0, 90.0, 120.0, 80.0,
-            150.0, 50.0, 900000.0, 1.1,
-            65.0, 0.5, 0.3, 0.2,
-            105.0, 100.0, 95.0,
-            'BREAKOUT',
-            CURRENT_TIMESTAMP
-        )
-    """)
-    
-    yield con
-    
-    # Cleanup
-    set_test_db(None)  # Reset test connection
-    con.close()
+# Fields every market data record carries, and those that may be None
+REQUIRED_FIELDS = frozenset({
+    "token", "symbol", "name", "lotsize", "token_type",
+    "date", "open", "high", "low", "close", "volume",
+    "ma_200", "ma_50", "ma_20", "ma_200_distance",
+    "high_21d", "low_21d", "high_52w", "low_52w",
+    "ath", "atl", "volume_15d_avg", "volume_ratio",
+    "rsi_14", "macd", "macd_signal", "macd_hist",
+    "bb_upper", "bb_middle", "bb_lower",
+    "breakout_detected", "last_updated"
+})
 
-def test_get_all_market_data(test_db):
-    """Test getting all market data"""
+OPTIONAL_FIELDS = frozenset({
+    "ma_200", "ma_50", "ma_20", "ma_200_distance",
+    "high_21d", "low_21d", "high_52w", "low_52w",
+    "ath", "atl", "volume_15d_avg", "volume_ratio",
+    "rsi_14", "macd", "macd_signal", "macd_hist",
+    "bb_upper", "bb_middle", "bb_lower",
+    "breakout_detected"
+})
+
+@pytest.fixture(scope="session")
+def all_market_data(test_db):
+    """Fetch /api/v1/market-data once and share the parsed response"""
     response = client.get("/api/v1/market-data")
     assert response.status_code == 200
-    
-    data = response.json()
+    return response.json()
+
+def test_get_all_market_data(all_market_data):
+    """Test getting all market data"""
+    data = all_market_data
     assert isinstance(data, dict)
     assert "status" in data
     assert "message" in data
@@ -73,54 +64,114 @@ def test_get_all_market_data(test_db):
     assert isinstance(data["count"], int)
     assert data["count"] == len(data["data"])
     
-    # Verify data fields
+    # Verify data fields on every record at once
     if data["data"]:
-        first_record = data["data"][0]
-        required_fields = {
-            "token", "symbol", "name", "lotsize", "token_type",
-            "date", "open", "high", "low", "close", "volume",
-            "ma_200", "ma_50", "ma_20", "ma_200_distance",
-            "high_21d", "low_21d", "high_52w", "low_52w",
-            "ath", "atl", "volume_15d_avg", "volume_ratio",
-            "rsi_14", "macd", "macd_signal", "macd_hist",
-            "bb_upper", "bb_middle", "bb_lower",
-            "breakout_detected", "last_updated"
-        }
-        assert all(field in first_record for field in required_fields)
+        df = pd.DataFrame(data["data"])
+        missing = REQUIRED_FIELDS.difference(df.columns)
+        assert not missing, f"Missing fields: {missing}"
         
         # Verify numeric fields
-        assert isinstance(first_record["open"], (int, float))
-        assert isinstance(first_record["high"], (int, float))
-        assert isinstance(first_record["low"], (int, float))
-        assert isinstance(first_record["close"], (int, float))
-        assert isinstance(first_record["volume"], int)
+        for field in ("open", "high", "low", "close"):
+            assert pd.api.types.is_numeric_dtype(df[field]), f"{field} is not numeric"
+        assert pd.api.types.is_integer_dtype(df["volume"])
         
         # Verify optional fields can be None
-        optional_fields = {
-            "ma_200", "ma_50", "ma_20", "ma_200_distance",
-            "high_21d", "low_21d", "high_52w", "low_52w",
-            "ath", "atl", "volume_15d_avg", "volume_ratio",
-            "rsi_14", "macd", "macd_signal", "macd_hist",
-            "bb_upper", "bb_middle", "bb_lower",
-            "breakout_detected"
-        }
-        for field in optional_fields:
-            assert first_record[field] is None or isinstance(first_record[field], (int, float, str))
-
-def test_get_token_data(test_db):
+        optional_types = (int, float, str, type(None))
+        valid = df[sorted(OPTIONAL_FIELDS)].map(lambda value: isinstance(value, optional_types)).all()
+        assert valid.all(), f"Unexpected types for fields: {list(valid.index[~valid])}"
+
+def test_stream_market_data(test_db):
+    """Test streaming all market data as NDJSON"""
+    with client.stream("GET", "/api/v1/market-data/stream") as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        rows = [json.loads(line) for line in response.iter_lines() if line]
+    
+    assert len(rows) == client.get("/api/v1/market-data").json()["count"]
+    assert rows[0]["token"] == "1234"
+    assert rows[0]["breakout_detected"] == "BREAKOUT"
+
+@pytest.mark.asyncio
+async def test_get_token_data(all_market_data):
     """Test getting data for a specific token"""
-    # Test with valid token
-    response = client.get("/api/v1/market-data/1234")
-    assert response.status_code == 200
+    token = all_market_data["data"][0]["token"]
+    
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+        # Fetch the valid token while probing an invalid one
+        response, invalid_response = await asyncio.gather(
+            ac.get(f"/api/v1/market-data/{token}"),
+            ac.get("/api/v1/market-data/invalid_token")
+        )
     
+    assert invalid_response.status_code == 404
+    assert response.status_code == 200
     data = response.json()
     assert data["status"] == "success"
     assert len(data["data"]) == 1
-    assert data["data"][0]["token"] == "1234"
+    assert data["data"][0]["token"] == token
+
+def test_flush_cache(test_db, monkeypatch):
+    """Test that cached market data is served and can be flushed with the admin token"""
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    first = client.get("/api/v1/market-data")
+    monkeypatch.setitem(market_data_api._CACHE, "payload", b"sentinel")
+    assert client.get("/api/v1/market-data").content == b"sentinel"
+    
+    assert client.post("/api/v1/admin/flush").status_code == 403
+    assert client.post("/api/v1/admin/flush", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert market_data_api._CACHE["payload"] == b"sentinel"
+    
+    response = client.post("/api/v1/admin/flush", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200
+    assert response.json()["status"] == "success"
+    assert market_data_api._CACHE["payload"] is None
+    
+    response = client.get("/api/v1/market-data")
+    assert response.status_code == 200
+    assert response.content != b"sentinel"
+    assert response.json()["count"] == first.json()["count"]
+
+def test_flush_disabled_without_admin_token(monkeypatch):
+    """Test that the flush endpoint is closed when ADMIN_TOKEN is not configured"""
+    monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+    assert client.post("/api/v1/admin/flush", headers={"X-Admin-Token": ""}).status_code == 403
+
+def test_cache_follows_snapshot(test_db, monkeypatch):
+    """Test that a new snapshot bypasses the cached payload without a flush"""
+    monkeypatch.setattr(market_data_api, "_snapshot_mtime", lambda: 1.0)
+    fresh = client.get("/api/v1/market-data").content
+    monkeypatch.setitem(market_data_api._CACHE, "payload", b"stale")
+    assert client.get("/api/v1/market-data").content == b"stale"
     
-    # Test with invalid token
-    response = client.get("/api/v1/market-data/invalid_token")
-    assert response.status_code == 404
+    monkeypatch.setattr(market_data_api, "_snapshot_mtime", lambda: 2.0)
+    assert client.get("/api/v1/market-data").content == fresh
+
+def test_market_data_not_modified(test_db, monkeypatch):
+    """Test that a client holding the current snapshot gets a 304"""
+    response = client.get("/api/v1/market-data")
+    assert response.status_code == 200
+    assert "last-modified" in response.headers
+    
+    etag = response.headers["etag"]
+    response = client.get("/api/v1/market-data", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert not response.content
+    
+    # Also answered when the payload is not cached
+    monkeypatch.setitem(market_data_api._CACHE, "key", None)
+    response = client.get("/api/v1/market-data", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+def test_envelope_matches_streamed_rows(test_db, monkeypatch):
+    """Test that the count and ETag are taken from the rows in the response"""
+    monkeypatch.setitem(market_data_api._CACHE, "key", None)
+    response = client.get("/api/v1/market-data")
+    data = response.json()
+    
+    assert data["count"] == len(data["data"])
+    latest = max(datetime.fromisoformat(row["last_updated"]) for row in data["data"])
+    assert response.headers["etag"] == f'"{latest.isoformat()}"'
 
 def test_error_handling():
     """Test error handling"""
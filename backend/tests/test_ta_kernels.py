@@ -0,0 +1,44 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# Add src directory to Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.data.ta_kernels import ema, rsi, macd
+
+def _reference_ema(close: pd.Series, length: int) -> pd.Series:
+    """SMA-seeded EMA as computed by pandas-ta"""
+    close = close.copy()
+    close.iloc[length - 1] = close.iloc[:length].mean()
+    close.iloc[:length - 1] = np.nan
+    return close.ewm(span=length, adjust=False).mean()
+
+def _close_series() -> np.ndarray:
+    rng = np.random.default_rng(42)
+    return 100 + np.cumsum(rng.standard_normal(300))
+
+def test_rsi_matches_wilder_ewm():
+    close = _close_series()
+    change = pd.Series(close).diff()
+    gains = change.clip(lower=0).ewm(alpha=1 / 14, min_periods=14).mean()
+    losses = (-change.clip(upper=0)).ewm(alpha=1 / 14, min_periods=14).mean()
+    expected = 100 * gains / (gains + losses)
+
+    np.testing.assert_allclose(rsi(close, 14), expected.to_numpy(), rtol=1e-10)
+
+def test_macd_matches_seeded_ewm():
+    close = pd.Series(_close_series())
+    expected_macd = _reference_ema(close, 12) - _reference_ema(close, 26)
+    expected_signal = _reference_ema(expected_macd.iloc[25:].reset_index(drop=True), 9)
+
+    macd_line, signal_line, hist = macd(close.to_numpy(), 12, 26, 9)
+    np.testing.assert_allclose(macd_line, expected_macd.to_numpy(), rtol=1e-10)
+    np.testing.assert_allclose(signal_line[25:], expected_signal.to_numpy(), rtol=1e-10)
+    np.testing.assert_allclose(hist, macd_line - signal_line)
+
+def test_short_series_returns_nan():
+    close = np.array([1.0, 2.0, 3.0])
+    assert np.isnan(ema(close, 5)).all()
+    assert np.isnan(rsi(close, 14)).all()
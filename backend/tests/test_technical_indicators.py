@@ -1,11 +1,9 @@
 import os
 import sys
-import traceback
 from logzero import logger, setup_logger
-import duckdb
 import logzero
+import pandas as pd
 from datetime import datetime, timedelta
-import pytz
 
 # Add the project root to Python path
 project_root = os.path.dirname(os.path.abspath(__file__))
@@ -21,12 +19,12 @@ def test_technical_indicators():
     try:
         # Initialize managers
         token_manager = TokenManager()
-        indicator_manager = TechnicalIndicatorManager()
+        indicator_manager = TechnicalIndicatorManager(token_manager.con)
         
         # Get 5 spot tokens for testing
         con = None
         try:
-            con = duckdb.connect(token_manager.db_file)
+            con = token_manager.connect()
             spot_tokens = con.execute("""
                 SELECT DISTINCT 
                     h.token,
@@ -37,46 +35,46 @@ def test_technical_indicators():
                 GROUP BY h.token, h.symbol
                 HAVING COUNT(*) > 200  -- Ensure we have enough data for MA calculation
                 LIMIT 5
-            """).fetchall()
+            """).fetchdf()
             
-            if not spot_tokens:
+            if spot_tokens.empty:
                 logger.error("No spot tokens found with sufficient historical data")
                 return
                 
-            logger.info("\nSelected tokens for technical analysis:")
-            for token, symbol, count in spot_tokens:
-                logger.info(f"- {symbol} ({token}): {count} records")
+            logger.info("\nSelected tokens for technical analysis:\n" + spot_tokens.to_string(index=False))
             
-            # Calculate indicators for each token
-            for token, symbol, _ in spot_tokens:
-                logger.info(f"\nCalculating indicators for {symbol}...")
-                if indicator_manager.calculate_indicators(token):
-                    # Verify the calculations
-                    latest = indicator_manager.get_latest_indicators(token)
-                    if latest:
-                        logger.info(f"\nLatest indicators for {symbol}:")
-                        logger.info(f"- Date: {latest['date']}")
-                        logger.info(f"- 200-day MA Distance: {latest['ma_200_distance']:.2f}%")
-                        logger.info(f"- 21-day High/Low: {latest['high_21d']:.2f}/{latest['low_21d']:.2f}")
-                        logger.info(f"- 52-week High/Low: {latest['high_52w']:.2f}/{latest['low_52w']:.2f}")
-                        logger.info(f"- ATH/ATL: {latest['ath']:.2f}/{latest['atl']:.2f}")
-                        logger.info(f"- 15-day Avg Volume: {latest['volume_15d_avg']:,.0f}")
-                        logger.info(f"- Volume Ratio: {latest['volume_ratio']:.2f}")
-                        logger.info(f"- Breakout Detected: {latest['breakout_detected']}")
-                    else:
-                        logger.error(f"No indicators found for {symbol}")
-                else:
-                    logger.error(f"Failed to calculate indicators for {symbol}")
+            # Calculate indicators for the selected tokens in one bulk pass
+            tokens = spot_tokens['token'].tolist()
+            logger.info("\nCalculating indicators for selected tokens...")
+            if not indicator_manager.calculate_all_indicators(tokens):
+                logger.error("Failed to calculate technical indicators")
+                return
+            
+            # Verify the calculations, fetching every token's latest row at once
+            latest_by_token = indicator_manager.get_latest_indicators_many(tokens)
+            
+            for symbol in spot_tokens.loc[~spot_tokens['token'].isin(list(latest_by_token)), 'symbol']:
+                logger.error(f"No indicators found for {symbol}")
+            
+            # Log every token's latest indicators as one formatted block
+            if latest_by_token:
+                latest = pd.DataFrame(latest_by_token.values())
+                logger.info("\nLatest indicators:\n" + latest[[
+                    'symbol', 'date', 'ma_200_distance', 'high_21d', 'low_21d',
+                    'high_52w', 'low_52w', 'ath', 'atl', 'volume_15d_avg',
+                    'volume_ratio', 'breakout_detected'
+                ]].to_string(index=False, float_format='{:.2f}'.format))
             
-            # Verify overall statistics
-            stats = con.execute("""
+            # Verify overall statistics from the exported Parquet snapshot
+            snapshot = os.path.join(indicator_manager.export_dir, 'technical_indicators.parquet')
+            stats = con.execute(f"""
                 SELECT 
                     COUNT(DISTINCT token) as token_count,
                     COUNT(*) as total_records,
                     MIN(date) as earliest_date,
                     MAX(date) as latest_date,
-                    COUNT(CASE WHEN breakout_detected THEN 1 END) as breakout_count
-                FROM technical_indicators
+                    COUNT(breakout_detected) as breakout_count
+                FROM read_parquet('{snapshot.replace("'", "''")}')
             """).fetchone()
             
             logger.info("\nOverall Technical Indicators Statistics:")
@@ -90,8 +88,7 @@ def test_technical_indicators():
                 con.close()
                 
     except Exception as e:
-        logger.error(f"❌ Test failed with error: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception(f"❌ Test failed with error: {str(e)}")
 
 if __name__ == "__main__":
     test_technical_indicators() 
\ No newline at end of file
@@ -1,5 +1,6 @@
 import os
 import sys
+import duckdb
 from logzero import logger
 from dotenv import load_dotenv
 
@@ -28,8 +29,20 @@ def test_token_filtering():
         if token_manager.download_and_store_tokens():
             logger.info("✅ Token download and storage completed successfully")
             
-            # Verify the data
-            con = token_manager.connect()
+            # Verify the data against an in-memory copy of the columns the checks read
+            token_con = token_manager.connect()
+            try:
+                snapshot = token_con.execute("""
+                    SELECT name, symbol, exch_seg, instrumenttype
+                    FROM tokens
+                """).fetch_arrow_table()
+            finally:
+                token_con.close()
+            
+            con = duckdb.connect(':memory:')
+            con.register('tokens_snapshot', snapshot)
+            con.execute("CREATE TABLE tokens AS SELECT * FROM tokens_snapshot")
+            con.unregister('tokens_snapshot')
             
             # Check futures tokens
             futures = con.execute("""
@@ -64,17 +77,18 @@ def test_token_filtering():
             logger.info(f"- Total options: {options[1]}")
             
             # Verify all spots have corresponding futures
+            # Anti-join against the distinct futures names, so the hash build side stays small
             missing_futures = con.execute("""
                 SELECT t1.name, t1.symbol
                 FROM tokens t1
+                LEFT JOIN (
+                    SELECT DISTINCT name
+                    FROM tokens
+                    WHERE instrumenttype = 'FUTSTK'
+                ) t2 ON t1.name = t2.name
                 WHERE t1.exch_seg = 'NSE'
                 AND t1.symbol LIKE '%-EQ'
-                AND NOT EXISTS (
-                    SELECT 1
-                    FROM tokens t2
-                    WHERE t2.instrumenttype = 'FUTSTK'
-                    AND t2.name = t1.name
-                )
+                AND t2.name IS NULL
             """).fetchall()
             
             if missing_futures:
@@ -89,9 +103,7 @@ def test_token_filtering():
             logger.error("❌ Token download and storage failed")
             
     except Exception as e:
-        logger.error(f"❌ Test failed with error: {str(e)}")
-        import traceback
-        logger.error(traceback.format_exc())
+        logger.exception(f"❌ Test failed with error: {str(e)}")
 
 if __name__ == "__main__":
     test_token_filtering() 
\ No newline at end of file